@@ -0,0 +1,97 @@
+# caches.py
+# Description: This file contains the bounded caches used for --memory-budget
+# in l1_linfty.py. A cache is a dict holding an OrderedDict of entries in
+# least recently used order, the (approximate) number of bytes they use and
+# hit statistics. When a cache is over its byte limit, the least recently used
+# entries are evicted; callers recompute evicted entries on demand.
+
+import sys
+import collections
+
+# Approximate bytes used by one entry of an OrderedDict (hash table slot and
+# linked list node), on top of the key and value themselves.
+ENTRY_OVERHEAD = 100
+
+def approx_size(obj):
+    """Returns the approximate number of bytes used by <obj>, including the
+    objects it contains (for tuples, lists, sets, frozensets and dicts).
+    Small integers and booleans are shared by Python, so they count as 0.
+    Input: <obj>
+    Output: integer"""
+    if isinstance(obj, (bool, int)) and -5 <= obj <= 256:
+        return 0
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum( approx_size(k) + approx_size(v) for k, v in obj.items() )
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum( approx_size(x) for x in obj )
+    return size
+
+def new_cache(limit = None, complete = False):
+    """Returns an empty cache.
+    Input: <limit>, maximum number of bytes used by the entries, None for no
+                    limit, 0 for a cache which stores nothing (default None)
+           <complete>, whether a missing key means the value is None (True,
+                    e.g. for a precomputed set), rather than unknown (False).
+                    The first eviction makes a cache incomplete.
+    Output: dict"""
+    return {"table": collections.OrderedDict(), "limit": limit, "bytes": 0,
+            "complete": complete, "hits": 0, "absent": 0, "misses": 0, "evictions": 0}
+
+def cache_get(cache, key):
+    """Returns the value stored for <key> in <cache>, or None if there is none.
+    A missing key in a complete cache counts as "absent" (the cache answered
+    that there is no value), otherwise as a miss.
+    Input: <cache>, from new_cache
+           <key>, hashable
+    Output: value, or None"""
+    table = cache["table"]
+    value = table.get(key)
+    if value is None:
+        if cache["complete"]:
+            cache["absent"] += 1
+        else:
+            cache["misses"] += 1
+        return None
+    cache["hits"] += 1
+    if cache["limit"] is not None:
+        table.move_to_end(key)
+    return value
+
+def cache_put(cache, key, value):
+    """Stores <value> for <key> in <cache>, then evicts least recently used
+    entries until <cache> is within its byte limit.
+    Input: <cache>, from new_cache
+           <key>, hashable
+           <value>, not None
+    Output: void"""
+    limit = cache["limit"]
+    if limit == 0:
+        cache["complete"] = False
+        return
+    table = cache["table"]
+    if key in table:
+        return
+    table[key] = value
+    cache["bytes"] += approx_size(key) + approx_size(value) + ENTRY_OVERHEAD
+    if limit is None:
+        return
+    while cache["bytes"] > limit and table:
+        old_key, old_value = table.popitem(last = False)
+        cache["bytes"] -= approx_size(old_key) + approx_size(old_value) + ENTRY_OVERHEAD
+        cache["evictions"] += 1
+        cache["complete"] = False
+
+def cache_stats(cache):
+    """Returns the size and statistics of <cache>.
+    Input: <cache>, from new_cache
+    Output: dict with entries, bytes, limit, complete, hits, absent, misses,
+            hit_rate (the share of lookups answered by the cache, as a hit or
+            as absent from a complete cache) and evictions"""
+    answered = cache["hits"] + cache["absent"]
+    lookups = answered + cache["misses"]
+    return {"entries": len(cache["table"]), "bytes": cache["bytes"],
+            "limit": cache["limit"], "complete": cache["complete"],
+            "hits": cache["hits"], "absent": cache["absent"], "misses": cache["misses"],
+            "hit_rate": answered / lookups if lookups else 0.0,
+            "evictions": cache["evictions"]}
@@ -19,7 +19,13 @@
 import sys
 import math
 import itertools
+import os
+import io
 import time
+import random
+import contextlib
+import fractions
+import multiprocessing
 
 # Other files used:
 #############################################
@@ -29,6 +35,14 @@ import simple_methods
 import l1_methods
 # Linfty_methods contains linfty specific methods
 import linfty_methods
+# profiling contains the --profile support (phase timers, kernel counters)
+import profiling
+# nogoods contains the nogood store used by find_crescent_set
+import nogoods
+# caches contains the bounded caches used for --memory-budget
+import caches
+# vector_filter contains the NumPy candidate filter used with --vectorize
+import vector_filter
 
 #####################################################
 #####################################################
@@ -117,26 +131,57 @@ def has_crescent_dist(norm, points):
 #         forbidden_pts = forbidden_pts.union(both)
 #     return forbidden_pts
 
-def is_general(norm, points, grid_size, sto_forbidden_line_points,
-            sto_forbidden_circle_points, sto_is_line_like, speed, printFail = False):
+def is_general(norm, points, grid_size, sto_line_index,
+            sto_forbidden_circle_points, sto_is_line_like, speed, printFail = False,
+            lines_checked = False):
     """ Splitter function for is_general, based on speed. """
     # TODO use this for debugging, when done comment out
-    # fast = is_general_fast(norm, points, grid_size, sto_forbidden_line_points, sto_forbidden_circle_points, sto_is_line_like, False)
+    # fast = is_general_fast(norm, points, grid_size, sto_line_index, sto_forbidden_circle_points, sto_is_line_like, False)
     # slow = is_general_slow(norm, points, grid_size, False)
     # if slow != fast:
     #     print(points)
     #     print("Fast: ",fast)
-    #     is_general_fast(norm, points, grid_size, sto_forbidden_line_points, sto_forbidden_circle_points, sto_is_line_like, True)
+    #     is_general_fast(norm, points, grid_size, sto_line_index, sto_forbidden_circle_points, sto_is_line_like, True)
     #     print("Slow: ",slow)
     #     is_general_slow(norm, points, grid_size, True)
     #     print()
     #     return is_general_slow(norm, points, grid_size, False)
     # Actual function
     if speed == "fast":
-        return is_general_fast(norm, points, grid_size, sto_forbidden_line_points, sto_forbidden_circle_points, sto_is_line_like, printFail)
+        return is_general_fast(norm, points, grid_size, sto_line_index, sto_forbidden_circle_points, sto_is_line_like, printFail, lines_checked)
     elif speed == "slow":
         return is_general_slow(norm, points, grid_size, printFail)
 
+def check_linfty_circles(grid_size, printFail = True):
+    """Checks the batched Linfty circle check of is_general_fast
+    (linfty_methods.linfty_new_point_on_circle) against the per-triple one
+    (linfty_forbidden_circle_points for every triple, as in is_general_slow),
+    on every set of 4 points in <grid_size> and with each of its points as the
+    new point. Sets the per-triple code can't handle (3 points on a line) are
+    skipped; is_general_fast rejects those before looking at circles.
+    Input: <grid_size>
+           <printFail>, print the sets where they differ (default True)
+    Output: [good, sets, differences], where good is True if they always agree
+            and sets is the number of sets checked"""
+    sets = 0
+    differences = 0
+    for quad in itertools.combinations(simple_methods.grid_points(grid_size), 4):
+        try:
+            per_triple = [ len(linfty_methods.linfty_forbidden_circle_points(p, q, r, grid_size)
+                               .intersection(quad)) >= 4
+                           for p, q, r in itertools.combinations(quad, 3) ]
+        except ValueError:
+            continue
+        sets += 1
+        for new_point in quad:
+            rest = [ p for p in quad if p != new_point ]
+            batched = linfty_methods.linfty_new_point_on_circle(rest, new_point) is not None
+            if batched != any(per_triple):
+                differences += 1
+                if printFail:
+                    print("Circle check differs:", rest, new_point, "batched:", batched)
+    return [differences == 0, sets, differences]
+
 def is_general_slow(norm, points, grid_size, printFail = False):
     """ Determines whether a set of points is in general position.
     (This means: no lines, balls, or line-like configs of size 4.)
@@ -169,47 +214,64 @@ def is_general_slow(norm, points, grid_size, printFail = False):
     # Otherwise, is in general position.
     return True
 
-def is_general_fast(norm, points, grid_size, sto_forbidden_line_points,
-            sto_forbidden_circle_points, sto_is_line_like, printFail = False):
+def is_general_fast(norm, points, grid_size, sto_line_index,
+            sto_forbidden_circle_points, sto_is_line_like, printFail = False,
+            lines_checked = False):
     """ Determines whether a set of points is in general position.
     WARNING: (these lists) have to be precomputed
     WARNING: assumes points[:-1] is in general position, only checks last pt
     Input: <norm>, 1 if L1, 0 if Linfty
            <points>, list of points
-           <sto_forbidden_line_points>, dict, key (a1,a2,b1,b2), value
-                                        set of points which lie on line with a,b
-           <sto_forbidden_circle_points>, dict, key (a1,a2,b1,b2,c1,c2), value
-                                        set of point on circle with a,b,c
-           <sto_is_line_like>, set, set of all (a1,a2,b1,b2,c1,c2,d1,d2) which
-                                    are line-like
+           <sto_line_index>, list, lattice lines of the grid (see
+                             simple_methods.line_index)
+           <sto_forbidden_circle_points>, cache (see caches.py), key
+                                        (a1,a2,b1,b2,c1,c2), value set of
+                                        points on circle with a,b,c
+           <sto_is_line_like>, cache (see caches.py) of line-like configs, see
+                                    lookup_line_like
            <printFail>: print the reason it's not in general position, if it
                         isn't. (e.g. line, circle, linelike)
+           <lines_checked>: skip the line check, because the caller already
+                        knows there are no 3 points on a line (e.g. from
+                        line counters, see backtrack). Default False.
     Output: True/False (and printing if <printFail> is True)
     """
     # grid_size = simple_methods.find_grid_size(points)
     # No 3 points on a line
-    for p,q,r in itertools.combinations(points, 3):
-        if r in sto_forbidden_line_points[p + q]:
+    if not lines_checked:
+        line = simple_methods.three_on_a_line(sto_line_index, points)
+        if line:
             if printFail:
-                print("Line found: ", p, q, r)
+                print("Line found: ", line)
             return False
     # No 4 points on circle
-    # TODO: Fast (and incorrect) circle code, fix this.
-    # for p,q,r,s in itertools.combinations(points, 4):
-    #     if s in sto_forbidden_circle_points[p + q + r]:
-    #         if printFail:
-    #             print("Circle found: ", p, q, r, s, sto_forbidden_circle_points[p + q + r])
-    #         return False
-    # Slow (and correct) circle code:
-    for p,q,r in itertools.combinations(points, 3):
-        bad_circle_pts = forbidden_circle_points(norm,  p,q,r, grid_size)
-        if len( bad_circle_pts.intersection(points) ) >= 4:
+    if norm == 0 and points:
+        # Linfty: points[:-1] is in general position, so only the circles
+        # through the last point are new. They are checked arithmetically,
+        # in one pass over the pairs (see check_linfty_circles).
+        circle = linfty_methods.linfty_new_point_on_circle(points[:-1], points[-1])
+        if circle:
             if printFail:
-                print("Circle found: ",p,q,r,bad_circle_pts.intersection(points))
+                print("Circle found: ", circle)
             return False
+    else:
+        # L1: all triples against their (cached) circle points, slow but
+        # correct.
+        # TODO: Fast (and incorrect) circle code, fix this.
+        # for p,q,r,s in itertools.combinations(points, 4):
+        #     if s in sto_forbidden_circle_points[p + q + r]:
+        #         if printFail:
+        #             print("Circle found: ", p, q, r, s, sto_forbidden_circle_points[p + q + r])
+        #         return False
+        for p,q,r in itertools.combinations(points, 3):
+            bad_circle_pts = lookup_circle_points(norm, sto_forbidden_circle_points, p,q,r, grid_size)
+            if len( bad_circle_pts.intersection(points) ) >= 4:
+                if printFail:
+                    print("Circle found: ",p,q,r,bad_circle_pts.intersection(points))
+                return False
     # No 4 points in line-like
     for p,q,r,s in itertools.combinations(points, 4):
-        if p+q+r+s in sto_is_line_like:
+        if lookup_line_like(norm, sto_is_line_like, p,q,r,s):
             if printFail:
                 print("Line-like found: ",p, q, r, s)
             return False
@@ -240,6 +302,51 @@ def is_general_fast(norm, points, grid_size, sto_forbidden_line_points,
     return True
 
 
+def lookup_circle_points(norm, sto_forbidden_circle_points, p1, p2, p3, grid_size):
+    """Returns forbidden_circle_points(norm, p1, p2, p3, grid_size), from the
+    cache <sto_forbidden_circle_points> if it is there. Otherwise computes it
+    and stores it in the cache (which may evict other entries).
+    Input: <norm>, 1 if L1, 0 if Linfty
+           <sto_forbidden_circle_points>, cache (see caches.py)
+           <p1>, <p2>, <p3> points
+           <grid_size>
+    Output: set of points"""
+    if sto_forbidden_circle_points["limit"] == 0:
+        return forbidden_circle_points(norm, p1, p2, p3, grid_size)
+    key = p1 + p2 + p3
+    bad_points = caches.cache_get(sto_forbidden_circle_points, key)
+    if bad_points is None:
+        bad_points = forbidden_circle_points(norm, p1, p2, p3, grid_size)
+        caches.cache_put(sto_forbidden_circle_points, key, bad_points)
+    return bad_points
+
+def line_like_key(p1, p2, p3, p4):
+    """Returns the key of the configuration p1, p2, p3, p4 in sto_is_line_like:
+    the points sorted and concatenated, so that each configuration is stored
+    once rather than once per order.
+    Input: <p1>, <p2>, <p3>, <p4> points
+    Output: tuple (a1,a2,b1,b2,c1,c2,d1,d2)"""
+    a, b, c, d = sorted((p1, p2, p3, p4))
+    return a + b + c + d
+
+def lookup_line_like(norm, sto_is_line_like, p1, p2, p3, p4):
+    """Determines whether p1, p2, p3, p4 form a line-like configuration, using
+    the cache <sto_is_line_like>. If the cache is complete (everything was
+    precomputed and nothing was evicted) a missing key means not line-like;
+    otherwise is_line_like is computed and stored.
+    Input: <norm>, 1 if L1, 0 if Linfty
+           <sto_is_line_like>, cache (see caches.py)
+           <p1>, <p2>, <p3>, <p4> points
+    Output: True / False"""
+    key = line_like_key(p1, p2, p3, p4)
+    value = caches.cache_get(sto_is_line_like, key)
+    if value is None:
+        if sto_is_line_like["complete"]:
+            return False
+        value = bool(is_line_like(norm, p1, p2, p3, p4))
+        caches.cache_put(sto_is_line_like, key, value)
+    return value
+
 def is_crescent(norm, points, grid_size, printFail = False):
     """ Determines whether a set of points is crescent.
     Crescent means: in general position, and has "crescent" distance set.
@@ -281,77 +388,655 @@ def has_line_like(norm, points):
     return False
 
 
-def find_crescent_set(norm, crescent_size, grid_size, sto_values, speed="slow"):
+#####################################################
+#####################################################
+######      Candidate ordering  #####################
+#####################################################
+#####################################################
+
+# Value-ordering strategies for find_crescent_set. The search tries the
+# candidates of each depth in the order returned by order_candidates.
+ORDERS = ["lex", "center", "distances", "constrained"]
+# Orders which do not depend on the current set. These are applied once to the
+# whole grid; every pool is a suffix of it, so it is already in order.
+STATIC_ORDERS = ["lex", "center"]
+
+def center_key(p, grid_size):
+    """Sort key for center-out order: squared (doubled) Euclidean distance of
+    <p> to the center of the grid, then lexicographic.
+    Input: <p> point, <grid_size>
+    Output: tuple"""
+    return ( (2*p[0] - grid_size)**2 + (2*p[1] - grid_size)**2, p )
+
+def new_distance_count(norm, point, current_set, distances):
+    """Returns the number of distances from <point> to <current_set> which are
+    not already in <distances>.
+    Input: <norm>, 1 if L1, 0 if Linfty
+           <point>, point
+           <current_set>, list of points
+           <distances>, dict or set of distances of <current_set>
+    Output: integer"""
+    new = set()
+    for p in current_set:
+        d = dist(norm, point, p)
+        if d not in distances:
+            new.add(d)
+    return len(new)
+
+def blocked_count(point, current_set, pool, sto_line_index):
+    """Returns the number of points of <pool> which can no longer be added if
+    <point> is added to <current_set>, because they would be the third point on
+    a line. (Used for most-constrained-first order.)
+    Input: <point>, point
+           <current_set>, list of points
+           <pool>, set of points
+           <sto_line_index>, see init_sto
+    Output: integer"""
+    line_points, point_lines = sto_line_index
+    used_lines = set()
+    for p in current_set:
+        used_lines.update(point_lines[p])
+    blocked = set()
+    for i in point_lines[point]:
+        if i in used_lines:
+            blocked.update( pool.intersection(line_points[i]) )
+    blocked.discard(point)
+    return len(blocked)
+
+def order_candidates(norm, order, pool, current_set, grid_size, sto_values, rng = None):
+    """Orders the candidates <pool> for the next point of <current_set>.
+    Input: <norm>, 1 if L1, 0 if Linfty
+           <order>, one of ORDERS:
+                lex: lexicographic (the grid order).
+                center: center-out.
+                distances: fewest new distinct distances first.
+                constrained: most-constrained first, i.e. the candidate which
+                             blocks the most remaining candidates (by lines)
+                             first, ties broken by fewest new distances.
+           <pool>, list of points
+           <current_set>, list of points
+           <grid_size>
+           <sto_values>, see init_sto
+           <rng>, random.Random used to break ties randomly, or None
+    Output: list of points (<pool> reordered)"""
+    pool = list(pool)
+    if rng is not None:
+        rng.shuffle(pool)
+        if order == "lex":
+            return pool
+    if order in STATIC_ORDERS and not current_set and rng is None:
+        if order == "center":
+            pool.sort(key = lambda p: center_key(p, grid_size))
+        return pool
+    if order == "center":
+        # Stable sort, so a shuffled pool gets random tie breaking.
+        pool.sort(key = lambda p: center_key(p, grid_size)[0])
+    elif order == "distances":
+        distances = distance_set(norm, current_set)
+        pool.sort(key = lambda p: new_distance_count(norm, p, current_set, distances))
+    elif order == "constrained":
+        distances = distance_set(norm, current_set)
+        pool_set = set(pool)
+        pool.sort(key = lambda p: ( - blocked_count(p, current_set, pool_set, sto_values[0]),
+                                    new_distance_count(norm, p, current_set, distances) ))
+    return pool
+
+#####################################################
+#####################################################
+######      Search  #################################
+#####################################################
+#####################################################
+
+def check_new_point(norm, crescent_size, current_set, grid_size, sto_values, speed,
+                    lines_checked = False):
+    """Checks <current_set> after a point has been appended to it.
+    Input: see find_crescent_set
+           <lines_checked>, see is_general_fast
+    Output: "found" if <current_set> is a crescent set of size <crescent_size>,
+            "reject" if no crescent set of that size contains it,
+            "extend" otherwise """
+    sto_line_index, sto_forbidden_circle_points, sto_is_line_like = sto_values
+    if not is_general(norm, current_set, grid_size, sto_line_index, sto_forbidden_circle_points,
+                      sto_is_line_like, speed, False, lines_checked):
+        return "reject"
+    elif len( distance_set(norm, current_set) ) >= crescent_size:
+        return "reject"
+    elif len(current_set) >= crescent_size and has_crescent_dist(norm, current_set):
+        return "found"
+    elif len(current_set) >= crescent_size:
+        return "reject"
+    return "extend"
+
+def backtrack(norm, crescent_size, grid_size, sto_values, speed, order = "lex",
+              rng = None, node_limit = None, nogood_store = None, prefix = None,
+              eta_probes = None, on_found = None, vectorize = False):
+    """Backtracking search for a crescent set, used by find_crescent_set.
+    Each depth has an ordered list of candidates. After a candidate has been
+    tried, only the candidates after it in that list are used below it, so
+    every set of points is visited at most once, whatever the order.
+    Input: see find_crescent_set
+           <rng>, random.Random for randomized tie breaking, or None
+           <node_limit>, stop after this many nodes, or None
+           <nogood_store>, nogood store (see nogoods.py), or None. Only used
+                     in the lex order without <rng>: every node whose subtree
+                     has no crescent set is stored, and cut off when it comes
+                     up again shifted to the right.
+           <prefix>, list of points in increasing lexicographic order, or
+                     None. If given, only the sets whose lexicographically
+                     smallest points are <prefix> are searched. The prefixes
+                     of a fixed length split the search into disjoint parts
+                     (used by work_queue.py).
+           <eta_probes>, if not None, estimate the size of the search with
+                     this many random probes first (see estimate_search), and
+                     print the progress and ETA with the periodic progress.
+           <on_found>, if not None, a function which is called with each
+                     crescent set found, and the search goes on (used by
+                     count_crescent_sets). The list passed is reused, copy it
+                     to keep it.
+           <vectorize>, if True, drop the candidates which can never be
+                     added below a node with NumPy first (see
+                     vector_filter.py). Gives the same sets with fewer nodes.
+    Output: [status, current_set, count], where status is
+                "found" (current_set is a crescent set),
+                "exhausted" (there is no crescent set in the grid, or with
+                             the <prefix>), or
+                "cutoff" (<node_limit> was reached)
+            and count is the number of nodes (points tried)."""
+    grid = simple_methods.grid_points(grid_size)
+    static = order in STATIC_ORDERS and rng is None
+    sto_line_index = sto_values[0]
+    # Number of points of current_set on each line, so that 3 points on a
+    # line are found without looking at triples.
+    line_counts = simple_methods.new_line_counts(sto_line_index)
+    current_set = []
+    count = 0
+    if not (static and order == "lex"):
+        nogood_store = None
+    # Number of crescent sets found so far (a subtree is dead if this did not
+    # change while it was searched).
+    found = 0
+    vf = None
+    if vectorize:
+        vf = vector_filter.new_vector_filter(norm, grid_size, sto_line_index)
+    for p in prefix or []:
+        count += 1
+        current_set.append(p)
+        if simple_methods.add_to_lines(sto_line_index, line_counts, p):
+            return ["exhausted", None, count]
+        if vf is not None:
+            vector_filter.push_point(vf, p, line_counts)
+        if nogood_store is not None and nogoods.is_nogood(nogood_store,
+                                                          nogoods.nogood_key(nogood_store, current_set)):
+            return ["exhausted", None, count]
+        status = check_new_point(norm, crescent_size, current_set, grid_size, sto_values,
+                                 speed, True)
+        if status == "found":
+            if on_found is None:
+                return ["found", current_set, count]
+            on_found(current_set)
+            return ["exhausted", None, count]
+        elif status == "reject":
+            return ["exhausted", None, count]
+    if prefix:
+        grid = grid[grid.index(prefix[-1]) + 1:]
+    # stack[k] = [candidates for point k, index of next candidate to try,
+    #             grid indices of the candidates if <vectorize>, else None]
+    stack = [ [order_candidates(norm, order, grid, current_set, grid_size, sto_values, rng), 0, None] ]
+    # frame_keys[k] = [nogood key of the set below stack[k], found when it was
+    # pushed], or None
+    frame_keys = [None]
+    if nogood_store is not None and current_set:
+        frame_keys[0] = [nogoods.nogood_key(nogood_store, current_set), found]
+    if vf is not None:
+        stack[0][2] = vector_filter.point_indices(vf, stack[0][0])
+        if current_set:
+            stack[0] = vector_filter_frame(vf, norm, crescent_size, order, stack[0][2],
+                                           current_set, grid_size, sto_values, rng)
+    progress = None
+    if eta_probes:
+        progress = estimate_search(norm, crescent_size, grid_size, sto_values, speed,
+                                   stack[0][0], current_set, eta_probes, random.Random(0), order, vf)
+        print_estimate(progress)
+    start = time.time()
+    while stack:
+        frame = stack[-1]
+        candidates, i = frame[0], frame[1]
+        if i >= len(candidates) or len(current_set) + len(candidates) - i < crescent_size:
+            # No candidates left (or too few to reach <crescent_size>).
+            stack.pop()
+            entry = frame_keys.pop()
+            if entry is not None and entry[1] == found:
+                nogoods.add_nogood(nogood_store, entry[0])
+            if current_set:
+                p = current_set.pop()
+                if vf is not None:
+                    vector_filter.pop_point(vf, p, line_counts)
+                simple_methods.remove_from_lines(sto_line_index, line_counts, p)
+            continue
+        frame[1] = i + 1
+        if node_limit is not None and count >= node_limit:
+            return ["cutoff", None, count]
+        if progress is not None and len(stack) == 1:
+            # Start of the ith top-level branch.
+            progress["branch"] = i
+            progress["branch_start"] = count
+        count += 1
+        if count % 100000 == 0:
+            print(time.time() - start,current_set)
+            if progress is not None:
+                print(progress_line(progress, count, time.time() - start))
+        current_set.append(candidates[i])
+        key = None
+        if nogood_store is not None:
+            key = nogoods.nogood_key(nogood_store, current_set)
+        if simple_methods.add_to_lines(sto_line_index, line_counts, candidates[i]):
+            status = "reject"
+        elif nogoods.is_nogood(nogood_store, key):
+            status = "reject"
+        else:
+            status = check_new_point(norm, crescent_size, current_set, grid_size, sto_values,
+                                     speed, True)
+        if status == "extend":
+            frame_keys.append(None if key is None else [key, found])
+        if status == "found" and on_found is None:
+            return ["found", current_set, count]
+        elif status == "found":
+            found += 1
+            on_found(current_set)
+            simple_methods.remove_from_lines(sto_line_index, line_counts, current_set.pop())
+        elif status == "reject":
+            simple_methods.remove_from_lines(sto_line_index, line_counts, current_set.pop())
+        elif vf is not None:
+            vector_filter.push_point(vf, candidates[i], line_counts)
+            stack.append(vector_filter_frame(vf, norm, crescent_size, order, frame[2][i+1:],
+                                             current_set, grid_size, sto_values, rng))
+        elif static:
+            # The rest of the candidate list is already in order, share it.
+            stack.append( [candidates, i + 1, None] )
+        else:
+            pool = candidates[i+1:]
+            stack.append( [order_candidates(norm, order, pool, current_set, grid_size, sto_values, rng), 0, None] )
+    return ["exhausted", None, count]
+
+def vector_filter_frame(vf, norm, crescent_size, order, pool_indices, current_set,
+                        grid_size, sto_values, rng):
+    """Returns the stack frame of backtrack (with <vectorize>) for the
+    candidates <pool_indices> below <current_set>: the candidates which can
+    never be added to <current_set> are dropped (see vector_filter.py), and
+    the rest are ordered. Only the remaining candidates are turned into points.
+    Input: <vf>, from vector_filter.new_vector_filter, holding <current_set>
+           <pool_indices>, NumPy array of the grid indices of the candidates
+           rest, see backtrack
+    Output: [candidates, 0, grid indices of the candidates]"""
+    pool_indices = vector_filter.filter_candidates(vf, pool_indices, crescent_size)
+    pool = vector_filter.index_points(vf, pool_indices)
+    if order in STATIC_ORDERS and rng is None:
+        return [pool, 0, pool_indices]
+    pool = order_candidates(norm, order, pool, current_set, grid_size, sto_values, rng)
+    return [pool, 0, vector_filter.point_indices(vf, pool)]
+
+def restart_cutoff(restarts, restart_base, i):
+    """Returns the node limit of the <i>th run (i >= 1) of a restart schedule.
+    Input: <restarts>, "luby" or "geometric"
+           <restart_base>, node limit of the first run
+           <i>, integer
+    Output: integer"""
+    if restarts == "luby":
+        return restart_base * simple_methods.luby(i)
+    elif restarts == "geometric":
+        return restart_base * 2**(i - 1)
+    raise ValueError(restarts)
+
+def find_crescent_set(norm, crescent_size, grid_size, sto_values, speed="slow",
+                      order="lex", seed=None, restarts=None, restart_base=1000,
+                      max_restarts=None, nogood_store=None, eta_probes=None,
+                      vectorize=False):
     """ Finds a crescent set of size <crescent_size> in <grid_size>.
     Input: <norm>, 1 if L1, 0 if Linfty
            <crescent_size>, size of crescent set.
            <grid_size>, size of grid.
            <sto_values>, list with three items, which contain
-                <sto_forbidden_line_points>, dict, key (a1,a2,b1,b2), value
-                                    set of points which lie on line with a,b
-                <sto_forbidden_circle_points>, dict, key (a1,a2,b1,b2,c1,c2),
-                                    value set of point on circle with a,b,c
-                <sto_is_line_like>, set, set of all (a1,a2,b1,b2,c1,c2,d1,d2)
-                                    which are line-like
+                <sto_line_index>, list, the lattice lines of the grid with
+                                    at least 3 points (see
+                                    simple_methods.line_index)
+                <sto_forbidden_circle_points>, cache (see caches.py), key
+                                    (a1,a2,b1,b2,c1,c2), value set of points
+                                    on circle with a,b,c (see init_sto)
+                <sto_is_line_like>, cache (see caches.py), key line_like_key
+                                    of a configuration, value True if it is
+                                    line-like (see init_sto)
            <speed>, slow or fast. Default slow. Slow computes each is_general
                     from scratch, fast uses precomputed stuff. Fast has bugs
+           <order>, candidate order, one of ORDERS (see order_candidates).
+                    Default lex.
+           <seed>, if not None, break ties in <order> randomly with this seed.
+           <restarts>, None, "luby" or "geometric". With a seed, restart the
+                    search with a new random order whenever the node limit of
+                    the schedule is reached.
+           <restart_base>, node limit of the first run, at least 1
+                    (default 1000).
+           <max_restarts>, after this many runs, the last run has no node
+                    limit (default None: never, but the limits grow without
+                    bound, so the search still ends).
+           <nogood_store>, nogood store (see nogoods.new_nogood_store), or None.
+                    Subtrees searched without finding a crescent set are cut
+                    off when they come up again shifted to the right (lex
+                    order without <seed> only). The store must only be shared
+                    between searches with the same <norm>, <crescent_size> and
+                    <grid_size> which together visit the sets in one
+                    increasing lex order (see nogoods.py).
+           <eta_probes>, if not None, estimate the size of the search with
+                    this many probes and report progress and ETA (only for
+                    runs without a node limit).
+           <vectorize>, drop candidates in bulk with NumPy (see
+                    vector_filter.py). Default False.
     Output: Set of points (crescent set), or None if none exists.
+    Every run visits each set of points at most once, so a run which ends
+    without reaching its node limit has searched the whole grid.
     """
-    sto_forbidden_line_points, sto_forbidden_circle_points, sto_is_line_like = sto_values
-    count = 0
-    start = time.time()
-    current_set = []
-    next_to_add = (0,0)
-    while next_to_add:
-        count += 1
-        if count % 100000 == 0:
-            print(time.time() - start,current_set)
-        current_set.append(next_to_add)
-        needs_pop = False # whether last element needs to be popped
-        if not is_general(norm, current_set, grid_size, sto_forbidden_line_points, sto_forbidden_circle_points, sto_is_line_like, speed):
-            needs_pop = True
-        elif len( distance_set(norm, current_set) ) >= crescent_size:
-            needs_pop = True
-        elif len(current_set) >= crescent_size and has_crescent_dist(norm, current_set):
-            print("Crescent found!", current_set)
-            print(is_crescent(norm, current_set, grid_size, True))
-            return current_set
-        elif len(current_set) >= crescent_size:
-            needs_pop = True
-        if needs_pop:
-            current_set.pop()# the popped element is next_to_add
-        # Add next.
-        have_added = False
-        while not have_added and next_to_add:
-            next_next_to_add = simple_methods.increment_point(next_to_add, grid_size)
-            if next_next_to_add:
-                next_to_add = next_next_to_add
-                have_added = True
-            elif current_set:
-                next_to_add = current_set.pop()
-            else:# current_set is empty, and next_to_add = (8,8)
-                next_to_add = None# no crescent config, exist next
+    if restarts and restart_base < 1:
+        raise ValueError(restart_base)
+    rng = None
+    if seed is not None:
+        rng = random.Random(seed)
+    run = 1
+    while True:
+        node_limit = None
+        if restarts and rng is not None and (max_restarts is None or run <= max_restarts):
+            node_limit = restart_cutoff(restarts, restart_base, run)
+        status, current_set, count = backtrack(norm, crescent_size, grid_size, sto_values,
+                                               speed, order, rng, node_limit, nogood_store,
+                                               None, eta_probes if node_limit is None else None,
+                                               None, vectorize)
+        if status != "cutoff":
+            break
+        print("Restart", run, "after", count, "nodes")
+        run += 1
+    if status == "found":
+        print("Crescent found!", current_set)
+        print(is_crescent(norm, current_set, grid_size, True))
+        return current_set
     print("No crescent set, try a bigger grid_size.")
     return None
 
+def count_crescent_sets(norm, crescent_size, grid_size, sto_values, speed="fast",
+                        order="lex", nogood_store=None, eta_probes=None, prefix=None,
+                        vectorize=False):
+    """ Counts the crescent sets of size <crescent_size> in <grid_size>, by
+    searching the whole grid. No sets are stored: each set found adds
+    1 / (size of its orbit) to the counts up to symmetry, and every set of an
+    orbit is found, so these add up to the number of orbits.
+    Input: see find_crescent_set
+           <prefix>, only count the sets starting with <prefix> (see
+                     backtrack), or None
+    Output: dict with
+                "raw": number of crescent sets in the grid
+                "translation": number up to translation
+                "symmetry": number up to translation and symmetries of the
+                            square (D4)
+                "nodes": number of nodes searched
+            The counts up to symmetry are Fractions (whole numbers, unless
+            only part of the grid was searched, e.g. with a <prefix>).
+    """
+    counts = {"raw": 0, "translation": fractions.Fraction(0), "symmetry": fractions.Fraction(0)}
+    def on_found(points):
+        counts["raw"] += 1
+        counts["translation"] += fractions.Fraction(1, simple_methods.translation_count(points, grid_size))
+        counts["symmetry"] += fractions.Fraction(1, simple_methods.orbit_size(points, grid_size))
+    status, current_set, count = backtrack(norm, crescent_size, grid_size, sto_values, speed,
+                                           order, None, None, nogood_store, prefix, eta_probes,
+                                           on_found, vectorize)
+    counts["nodes"] = count
+    return counts
+
+#####################################################
+#####################################################
+######      Estimation  #############################
+#####################################################
+#####################################################
+
+def probe_filter(vf, points, sto_line_index):
+    """Returns a vector filter for a probe, holding <points>.
+    Input: <vf>, from vector_filter.new_vector_filter
+           <points>, list of points
+           <sto_line_index>, from init_lines
+    Output: [filter, line counters], see vector_filter.push_point"""
+    probe_vf = vector_filter.empty_copy(vf)
+    line_counts = simple_methods.new_line_counts(sto_line_index)
+    for p in points:
+        simple_methods.add_to_lines(sto_line_index, line_counts, p)
+        vector_filter.push_point(probe_vf, p, line_counts)
+    return [probe_vf, line_counts]
+
+def probe_pool(norm, crescent_size, order, pool, current_set, grid_size, sto_values, rng, vf):
+    """Returns the candidates below <current_set> in a probe, the way
+    backtrack makes them: filtered by <vf> (with --vectorize) and, for a
+    dynamic <order>, reordered (ties broken with <rng>).
+    Input: see knuth_probe
+           <pool>, the candidates after the chosen one in the parent's list
+           <vf>, from probe_filter, holding <current_set>, or None
+    Output: list of points"""
+    if vf is not None:
+        pool = vector_filter.index_points(vf, vector_filter.filter_candidates(
+            vf, vector_filter.point_indices(vf, pool), crescent_size))
+    if order not in STATIC_ORDERS:
+        pool = order_candidates(norm, order, pool, current_set, grid_size, sto_values, rng)
+    return pool
+
+def knuth_probe(norm, crescent_size, grid_size, sto_values, speed, current_set, pool, rng,
+                order = "lex", vf = None):
+    """Estimates the number of nodes backtrack visits below <current_set>
+    with candidates <pool>, and the time it takes, by one random probe
+    (Knuth's estimator): walk down the search tree choosing a random valid
+    child at each node, and add up the nodes tried (and the time to check
+    them) at each depth weighted by the product of the numbers of valid
+    children above. The expected values are the exact number of nodes and
+    (up to the timing noise) the time of the search.
+    Input: see find_crescent_set
+           <current_set>, list of points (in general position)
+           <pool>, list of candidates for the next point (already filtered
+                   and ordered, as in backtrack)
+           <rng>, random.Random
+           <order>, candidate order of the search (default lex)
+           <vf>, from vector_filter.new_vector_filter with --vectorize (its
+                 set of points is not used or changed), or None
+    Output: [estimate, checks, seconds], where checks is the number of points
+            checked and seconds the estimated time"""
+    current_set = list(current_set)
+    estimate = 0
+    seconds = 0.0
+    weight = 1
+    checks = 0
+    perf_counter = time.perf_counter
+    if vf is not None:
+        vf, line_counts = probe_filter(vf, current_set, sto_values[0])
+    while True:
+        # Same limit as in backtrack: leave enough candidates for a full set.
+        tries = min(len(pool), len(current_set) + len(pool) - crescent_size + 1)
+        if tries <= 0:
+            break
+        estimate += weight * tries
+        children = []
+        start = perf_counter()
+        for i in range(tries):
+            current_set.append(pool[i])
+            checks += 1
+            if check_new_point(norm, crescent_size, current_set, grid_size, sto_values, speed) == "extend":
+                children.append(i)
+            current_set.pop()
+        seconds += weight * (perf_counter() - start)
+        if not children:
+            break
+        weight *= len(children)
+        i = rng.choice(children)
+        current_set.append(pool[i])
+        start = perf_counter()
+        if vf is not None:
+            simple_methods.add_to_lines(sto_values[0], line_counts, pool[i])
+            vector_filter.push_point(vf, pool[i], line_counts)
+        pool = probe_pool(norm, crescent_size, order, pool[i+1:], current_set, grid_size,
+                          sto_values, rng, vf)
+        # Making the candidates is done once per valid child.
+        seconds += weight * (perf_counter() - start)
+    return [estimate, checks, seconds]
+
+def estimate_search(norm, crescent_size, grid_size, sto_values, speed, root, current_set,
+                    probes, rng, order = "lex", vf = None):
+    """Estimates the number of nodes and the time of a backtrack search, per
+    top-level branch. Each branch (a point of <root> and the candidates after
+    it) gets an equal share of <probes> (at least 1).
+    Input: see find_crescent_set
+           <root>, list of top-level candidates, in the order of the search
+           <current_set>, list of points the search starts from (a prefix)
+           <probes>, number of probes
+           <rng>, random.Random
+           <order>, <vf>, see knuth_probe
+    Output: dict with
+                "estimates": list, estimated nodes of each top-level branch
+                "suffix": list, suffix[i] = sum of estimates[i:]
+                "nodes": estimated total nodes
+                "seconds": estimated time of the search
+                "seconds_per_node": "seconds" / "nodes"
+                "probes", "checks", "time": probes made, points they checked
+                                            and the time they took
+            plus "branch" and "branch_start", which backtrack updates"""
+    start_time = time.time()
+    per_branch = max(1, probes // max(1, len(root)))
+    estimates = []
+    seconds = 0.0
+    checks = 0
+    tries = min(len(root), len(current_set) + len(root) - crescent_size + 1)
+    for i in range(max(0, tries)):
+        branch_set = current_set + [root[i]]
+        checks += 1
+        start = time.perf_counter()
+        status = check_new_point(norm, crescent_size, branch_set, grid_size, sto_values, speed)
+        if status == "extend":
+            branch_vf = None
+            if vf is not None:
+                branch_vf = probe_filter(vf, branch_set, sto_values[0])[0]
+            pool = probe_pool(norm, crescent_size, order, root[i+1:], branch_set, grid_size,
+                              sto_values, rng, branch_vf)
+        seconds += time.perf_counter() - start
+        if status != "extend":
+            estimates.append(1)
+            continue
+        total = 0
+        total_seconds = 0.0
+        for j in range(per_branch):
+            estimate, probe_checks, probe_seconds = knuth_probe(
+                norm, crescent_size, grid_size, sto_values, speed, branch_set, pool, rng, order, vf)
+            total += estimate
+            total_seconds += probe_seconds
+            checks += probe_checks
+        estimates.append(1 + total / per_branch)
+        seconds += total_seconds / per_branch
+    suffix = [0] * (len(estimates) + 1)
+    for i in reversed(range(len(estimates))):
+        suffix[i] = suffix[i + 1] + estimates[i]
+    elapsed = time.time() - start_time
+    return {"estimates": estimates, "suffix": suffix, "nodes": suffix[0],
+            "seconds": seconds,
+            "seconds_per_node": seconds / suffix[0] if suffix[0] else 0.0,
+            "probes": per_branch * len(estimates), "checks": checks, "time": elapsed,
+            "branch": 0, "branch_start": 0}
+
+def format_seconds(seconds):
+    """Returns <seconds> as a string like 3d 04:05:06."""
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    text = "%02d:%02d:%02d" % (hours, minutes, seconds)
+    if days:
+        text = str(days) + "d " + text
+    return text
+
+def print_estimate(progress):
+    """Prints the estimate from estimate_search.
+    Input: <progress>, dict from estimate_search
+    Output: void (prints)"""
+    print("Estimated nodes:", int(progress["nodes"]), "in", len(progress["estimates"]),
+          "top-level branches (" + str(progress["probes"]) + " probes,",
+          "%.2fs)" % progress["time"])
+    print("Estimated time:", format_seconds(progress["seconds"]))
+
+def progress_line(progress, count, elapsed):
+    """Returns a progress report for a running backtrack search. Finished
+    top-level branches count with their actual number of nodes, the current
+    one with its estimate (or its nodes so far, if that is more) and the
+    remaining ones with their estimates.
+    Input: <progress>, dict from estimate_search, updated by backtrack
+           <count>, nodes so far
+           <elapsed>, seconds so far
+    Output: string"""
+    i = progress["branch"]
+    done = progress["branch_start"]
+    estimates = progress["estimates"]
+    total = done + max(count - done, estimates[i] if i < len(estimates) else 0) + progress["suffix"][i + 1]
+    eta = elapsed / count * (total - count) if count else 0
+    return ("Progress: %d of ~%d nodes (%.1f%%), top-level branch %d of %d, ETA %s"
+            % (count, total, 100.0 * count / total, i + 1, len(estimates), format_seconds(eta)))
+
 #####################################################
 #####################################################
 ######      Sto init function  ######################
 #####################################################
 #####################################################
 
-def init_sto(norm, grid_size, printStuff = False):
+def init_lines(grid_size):
+    """Precomputes the lines of the grid. This does not depend on the norm, so
+    it can be shared between init_sto calls for different norms.
+    Input:  <grid_size>
+    Output: <sto_line_index>, list, the lattice lines of the grid with at least
+                                    3 points (see simple_methods.line_index)
+    """
+    with profiling.phase("precompute_lines"):
+        return simple_methods.line_index(grid_size)
+
+# Shares of a --memory-budget given to each cache, by norm, after the line
+# index (which is small and always kept) has been paid for. Linfty checks
+# circles arithmetically (linfty_methods.linfty_new_point_on_circle), so it
+# does not use the circle cache.
+MEMORY_SHARES = {1: {"line_like": 0.4, "circles": 0.4, "nogoods": 0.2},
+                 0: {"line_like": 0.8, "circles": 0.0, "nogoods": 0.2}}
+
+def memory_limits(norm, memory_budget, sto_line_index):
+    """Splits <memory_budget> between the caches according to MEMORY_SHARES.
+    Input:  <norm>, 1 if L1, 0 if Linfty
+            <memory_budget>, number of bytes, or None for no budget
+            <sto_line_index>, from init_lines
+    Output: dict, key cache name, value byte limit (None for no limit). With
+            no budget the circle cache is off (limit 0)."""
+    if memory_budget is None:
+        return {"line_like": None, "circles": 0, "nogoods": None}
+    remaining = max(0, memory_budget - caches.approx_size(sto_line_index))
+    return { name: int(remaining * share) for name, share in MEMORY_SHARES[norm].items() }
+
+def init_sto(norm, grid_size, printStuff = False, sto_line_index = None,
+             memory_budget = None):
     """
     Input:  <norm> 1 if L1, 0 if Linfty
             <grid_size>
             <printStuff>, whether to print time, which step we are doing, etc
+            <sto_line_index>, lines from init_lines(grid_size), if already
+                                    computed (default None)
+            <memory_budget>, number of bytes the precompute and caches may use,
+                                    or None for no limit (default None)
     Output: <sto_values>, which is a list of three things:
-                <sto_forbidden_line_points>, dict, key (a1,a2,b1,b2), value
-                                    set of points which lie on line with a,b
-                <sto_forbidden_circle_points>, dict, key (a1,a2,b1,b2,c1,c2),
-                                    value set of point on circle with a,b,c
-                <sto_is_line_like>, set, set of all (a1,a2,b1,b2,c1,c2,d1,d2)
-                                    which are line-like
+                <sto_line_index>, list, the lattice lines of the grid with at
+                                    least 3 points (see simple_methods.line_index)
+                <sto_forbidden_circle_points>, cache (see caches.py), key
+                                    (a1,a2,b1,b2,c1,c2), value set of points on
+                                    circle with a,b,c. Only used with a
+                                    <memory_budget>; filled during the search.
+                <sto_is_line_like>, cache (see caches.py), key line_like_key
+                                    of a configuration, value True if it is
+                                    line-like. Without a <memory_budget> every
+                                    line-like configuration is precomputed.
+                                    With one, the precompute stops when the
+                                    budget is full and the rest is computed
+                                    (and evicted) during the search.
     """
     start_time = time.time()
     if printStuff:
@@ -363,17 +1048,16 @@ def init_sto(norm, grid_size, printStuff = False):
     # Compute grid
     grid = [ (i,j) for i in range(grid_size + 1) for j in range(grid_size + 1) ]
     # Lines
-    sto_forbidden_line_points = dict()
-    if printStuff:
-        print("Precomputing lines...")
-    for a,b in itertools.combinations(grid, 2):
-        sto_forbidden_line_points[a+b] = simple_methods.forbidden_line_points(a, b, grid_size)
-        sto_forbidden_line_points[b+a] = sto_forbidden_line_points[a+b]
-    if printStuff:
-        print("DONE in",time.time() - start_time)
+    if sto_line_index is None:
+        if printStuff:
+            print("Precomputing lines...")
+        sto_line_index = init_lines(grid_size)
+        if printStuff:
+            print("DONE in",time.time() - start_time)
+    limits = memory_limits(norm, memory_budget, sto_line_index)
     start_time = time.time()
     # Circles
-    sto_forbidden_circle_points = dict()
+    sto_forbidden_circle_points = caches.new_cache(limits["circles"])
     # TODO Uncomment this to precompute circles again.
     # if printStuff:
     #     print("Precomputing circles...")
@@ -388,16 +1072,148 @@ def init_sto(norm, grid_size, printStuff = False):
     #     print("DONE in", time.time() - start_time)
     start_time = time.time()
     # Line-like configs
-    sto_is_line_like = set()
+    sto_is_line_like = caches.new_cache(limits["line_like"], complete = True)
     if printStuff:
         print("Precomputing line-like configs...")
-    for a,b,c,d in itertools.combinations(grid, 4):
-        if is_line_like(norm,a,b,c,d):
-            for p1, p2, p3, p4 in itertools.permutations([a,b,c,d], 4):
-                sto_is_line_like.add(p1+p2+p3+p4)
+    with profiling.phase("precompute_line_like"):
+        for a,b,c,d in itertools.combinations(grid, 4):
+            if is_line_like(norm,a,b,c,d):
+                caches.cache_put(sto_is_line_like, line_like_key(a,b,c,d), True)
+                if not sto_is_line_like["complete"]:
+                    # Over budget, compute the rest on demand.
+                    break
     if printStuff:
         print("DONE in", time.time() - start_time)
-    return [sto_forbidden_line_points, sto_forbidden_circle_points, sto_is_line_like]
+        if not sto_is_line_like["complete"]:
+            print("Memory budget reached, line-like configs are computed during the search.")
+    return [sto_line_index, sto_forbidden_circle_points, sto_is_line_like]
+
+def memory_report(sto_values, nogood_store = None):
+    """Returns the memory footprint and hit statistics of the precompute and
+    the caches.
+    Input:  <sto_values>, from init_sto
+            <nogood_store>, from nogoods.new_nogood_store, or None
+    Output: dict, key name, value dict of statistics (bytes, entries, ...)"""
+    sto_line_index, sto_forbidden_circle_points, sto_is_line_like = sto_values
+    report = {"lines": {"bytes": caches.approx_size(sto_line_index),
+                        "entries": len(sto_line_index[0])},
+              "line_like": caches.cache_stats(sto_is_line_like),
+              "circles": caches.cache_stats(sto_forbidden_circle_points)}
+    if nogood_store is not None:
+        report["nogoods"] = nogoods.nogood_stats(nogood_store)
+    return report
+
+#####################################################
+#####################################################
+######      Sweep  ##################################
+#####################################################
+#####################################################
+
+# Command line names of the norms.
+NORMS = {"l1": 1, "linfty": 0}
+PRINTABLE_NORMS = {1: "L1", 0: "Linfty"}
+
+# Lines for each grid size, shared by all sweep jobs. They do not depend on the
+# norm, so they are computed once in the main process before the workers are
+# forked.
+sweep_lines = dict()
+# sto_values of the (norm, grid_size) a worker process is on. Only one is
+# kept, so that a worker stays within the --memory-budget of one target.
+sweep_sto = dict()
+
+def parse_range(text):
+    """Parses a list of integers such as "4-9" or "4,6,8-10".
+    Input: <text>, string
+    Output: sorted list of integers (raises ValueError if malformed)"""
+    values = set()
+    for part in text.split(","):
+        low, sep, high = part.partition("-")
+        if sep:
+            values.update(range(int(low), int(high) + 1))
+        else:
+            values.add(int(low))
+    return sorted(values)
+
+def sweep_job(job):
+    """Runs one sweep target: finds a crescent set of size <crescent_size> in
+    the smallest grid of <grid_sizes> which has one.
+    Input: <job>, list [norm, crescent_size, grid_sizes, kwargs,
+           memory_budget], where kwargs are keyword arguments for
+           find_crescent_set and memory_budget is passed to init_sto
+    Output: [norm, crescent_size, grid_size, crescent_set, time], where
+            grid_size and crescent_set are None if no grid has a crescent set"""
+    norm, crescent_size, grid_sizes, kwargs, memory_budget = job
+    start_time = time.time()
+    store = kwargs.get("nogood_store")
+    for grid_size in grid_sizes:
+        if (norm, grid_size) not in sweep_sto:
+            sweep_sto.clear()
+            sweep_sto[(norm, grid_size)] = init_sto(norm, grid_size, False, sweep_lines.get(grid_size),
+                                                    memory_budget)
+        if store is not None:
+            # A nogood store is only valid for one norm and size, give each
+            # job its own (with the same limits).
+            limits = memory_limits(norm, memory_budget, sweep_sto[(norm, grid_size)][0])
+            kwargs = dict(kwargs, nogood_store = nogoods.new_nogood_store(store["limit"], store["min_size"],
+                                                                          limits["nogoods"]))
+        # find_crescent_set prints progress, keep it out of the summary.
+        with contextlib.redirect_stdout(io.StringIO()):
+            crescent_set = find_crescent_set(norm, crescent_size, grid_size,
+                                             sweep_sto[(norm, grid_size)], "fast", **kwargs)
+        if crescent_set:
+            return [norm, crescent_size, grid_size, crescent_set, time.time() - start_time]
+    return [norm, crescent_size, None, None, time.time() - start_time]
+
+def sweep(norms, crescent_sizes, grid_sizes, jobs = None, kwargs = None,
+          memory_budget = None):
+    """Finds crescent sets for every norm in <norms> and size in
+    <crescent_sizes>, each in the smallest grid of <grid_sizes> which has one.
+    The targets are run in parallel on <jobs> processes, largest first.
+    Input: <norms>, list of norms (1 if L1, 0 if Linfty)
+           <crescent_sizes>, list of sizes
+           <grid_sizes>, list of grid sizes, tried in increasing order
+           <jobs>, number of processes (default: number of cores)
+           <kwargs>, keyword arguments for find_crescent_set (default none)
+           <memory_budget>, bytes for the precompute and caches of each
+                            target, see init_sto (default None: no limit)
+    Output: list of results of sweep_job, sorted by norm and size"""
+    grid_sizes = sorted(grid_sizes)
+    for grid_size in grid_sizes:
+        if grid_size not in sweep_lines:
+            sweep_lines[grid_size] = init_lines(grid_size)
+    # Bigger sets take longer, start them first.
+    job_list = [ [norm, crescent_size, grid_sizes, kwargs or dict(), memory_budget]
+                 for crescent_size in sorted(crescent_sizes, reverse = True)
+                 for norm in norms ]
+    jobs = min(jobs or os.cpu_count() or 1, len(job_list))
+    if jobs <= 1:
+        results = [sweep_job(job) for job in job_list]
+    else:
+        # Fork, so the workers share sweep_lines instead of recomputing them.
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+        with context.Pool(jobs) as pool:
+            results = list(pool.imap_unordered(sweep_job, job_list))
+    results.sort(key = lambda result: (-result[0], result[1]))
+    return results
+
+def print_sweep_table(results):
+    """Prints the results of sweep as a table.
+    Input: <results>, list returned by sweep
+    Output: void (prints)"""
+    print("norm".ljust(8) + "size".ljust(6) + "result".ljust(8) + "grid".ljust(6)
+          + "time".ljust(10) + "crescent set")
+    for norm, crescent_size, grid_size, crescent_set, run_time in results:
+        if crescent_set:
+            result = "found"
+        else:
+            result = "none"
+            grid_size = "-"
+            crescent_set = ""
+        print(PRINTABLE_NORMS[norm].ljust(8) + str(crescent_size).ljust(6) + result.ljust(8)
+              + str(grid_size).ljust(6) + ("%.3f" % run_time).ljust(10) + str(crescent_set))
 
 #####################################################
 #####################################################
@@ -405,6 +1221,59 @@ def init_sto(norm, grid_size, printStuff = False):
 #####################################################
 #####################################################
 
+# Kernels counted by --profile, as (module, function name). Module None means
+# this file.
+PROFILED_KERNELS = [ (None, "forbidden_circle_points"),
+                     (None, "is_line_like"),
+                     (None, "distance_set"),
+                     (None, "order_candidates"),
+                     (linfty_methods, "linfty_new_point_on_circle") ]
+
+def parse_options(args):
+    """Splits command line arguments into positional arguments and options.
+    Options are written --name=value, or --name for a flag (value True).
+    Input: <args>, list of strings (sys.argv without the program name)
+    Output: [positional, options], a list of strings and a dict name: value"""
+    positional = []
+    options = dict()
+    for arg in args:
+        if arg.startswith("--"):
+            name, sep, value = arg[2:].partition("=")
+            options[name] = value if sep else True
+        else:
+            positional.append(arg)
+    return [positional, options]
+
+def start_profile(options, info):
+    """Starts profiling if --profile was given, and instruments the kernels in
+    PROFILED_KERNELS.
+    Input: <options>, dict from parse_options
+           <info>, dict of run parameters copied into the report
+    Output: void"""
+    if "profile" not in options:
+        return
+    profiling.start(info, cprofile = "cprofile" in options)
+    for module, name in PROFILED_KERNELS:
+        profiling.instrument(module or sys.modules[__name__], name)
+
+def finish_profile(options):
+    """Stops profiling (if active) and writes the JSON report given by
+    --profile=<path> (default profile.json), plus the cProfile dump given by
+    --cprofile=<path> (default profile.prof).
+    Input: <options>, dict from parse_options
+    Output: void"""
+    report = profiling.stop()
+    if report is None:
+        return
+    path = options["profile"]
+    if path is True:
+        path = "profile.json"
+    cprofile_path = options.get("cprofile")
+    if cprofile_path is True:
+        cprofile_path = "profile.prof"
+    profiling.write_report(report, path, cprofile_path)
+    print("Profile written to", path)
+
 def print_usage(args):
     print("Usage: python3 "+args[0]+" <norm>"+" <crescent_size>"+" <grid_size>")
     # TODO add back in <slow/fast> option
@@ -413,40 +1282,240 @@ def print_usage(args):
     print("\t linfty: Linfty (sup metric).")
     print("crescent_size: Size of crescent set being searched for.")
     print("grid_size: Searches grid from (0,0) to (grid_size, grid_size)")
+    print("   or: python3 "+args[0]+" sweep <norms> <crescent_sizes> <grid_sizes>")
+    print("\t Finds a crescent set for each norm and size, in the smallest grid")
+    print("\t which has one, e.g. sweep l1,linfty 4-9 2-8. Option --jobs=<n>")
+    print("\t sets the number of processes (default: number of cores). The search")
+    print("\t options below apply, except --count, --eta, --estimate-only and --profile.")
+    print("   or: python3 "+args[0]+" check-circles <max_grid_size>")
+    print("\t Checks the batched Linfty circle check against the per-triple one on")
+    print("\t every set of 4 points in the grids up to <max_grid_size> (e.g. 5).")
+    print("options:")
+    print("\t --order=<order>: candidate order, one of "+", ".join(ORDERS)+" (default lex).")
+    print("\t --seed=<seed>: break ties in the candidate order randomly.")
+    print("\t --restarts=<luby/geometric>: with --seed (required), restart with a new random")
+    print("\t                              order on this node limit schedule.")
+    print("\t --restart-base=<nodes>: node limit of the first run (default 1000).")
+    print("\t --max-restarts=<runs>: after this many runs, run to completion.")
+    print("\t --nogoods[=<limit>]: remember subtrees without a crescent set and cut")
+    print("\t                      off their shifts to the right (lex order without")
+    print("\t                      --seed only, default limit 100000).")
+    print("\t --count: count all crescent sets (raw, up to translation, and up to")
+    print("\t          translation and symmetry) instead of finding one.")
+    print("\t --eta[=<probes>]: estimate the size of the search first (Knuth's")
+    print("\t                   estimator) and print progress and ETA (default")
+    print("\t                   "+str(DEFAULT_PROBES)+" probes).")
+    print("\t --estimate-only[=<probes>]: only print the estimated nodes and time.")
+    print("\t --vectorize: drop candidates which can never be added in bulk with")
+    print("\t              NumPy (distances, multiplicities, lines) before")
+    print("\t              checking the rest one by one.")
+    print("\t --memory-budget=<MB>: bound the precompute and caches, evicting least")
+    print("\t                       recently used entries and recomputing them.")
+    print("\t --profile[=<path>]: write per-phase and per-kernel timings as JSON")
+    print("\t                     (default profile.json).")
+    print("\t --cprofile[=<path>]: with --profile, also dump cProfile stats")
+    print("\t                      (default profile.prof).")
     # print("speed: Fast is buggy. Default slow")
 
+# Default number of probes for --eta and --estimate-only.
+DEFAULT_PROBES = 1000
+
+def search_options(options):
+    """Reads the options of find_crescent_set from the command line options.
+    Input: <options>, dict from parse_options
+    Output: dict of keyword arguments for find_crescent_set, or None if an
+            option is invalid"""
+    order = options.get("order", "lex")
+    restarts = options.get("restarts")
+    if order not in ORDERS or restarts not in [None, "luby", "geometric"]:
+        return None
+    try:
+        seed = options.get("seed")
+        if seed is not None:
+            seed = int(seed)
+        restart_base = int(options.get("restart-base", 1000))
+        max_restarts = options.get("max-restarts")
+        if max_restarts is not None:
+            max_restarts = int(max_restarts)
+        eta_probes = None
+        if "eta" in options:
+            eta_probes = DEFAULT_PROBES if options["eta"] is True else int(options["eta"])
+        nogood_store = None
+        if "nogoods" in options:
+            limit = options["nogoods"]
+            if limit is True:
+                nogood_store = nogoods.new_nogood_store()
+            else:
+                nogood_store = nogoods.new_nogood_store(int(limit))
+    except ValueError:
+        return None
+    if restart_base < 1:
+        print("--restart-base must be at least 1")
+        return None
+    if restarts is not None and seed is None:
+        print("--restarts needs --seed")
+        return None
+    if nogood_store is not None and (order != "lex" or seed is not None):
+        print("--nogoods needs --order=lex and no --seed")
+        return None
+    vectorize = "vectorize" in options
+    if vectorize and vector_filter.numpy is None:
+        print("--vectorize needs numpy")
+        return None
+    return {"order": order, "seed": seed, "restarts": restarts,
+            "restart_base": restart_base, "max_restarts": max_restarts,
+            "nogood_store": nogood_store, "eta_probes": eta_probes,
+            "vectorize": vectorize}
+
+def memory_budget_option(options):
+    """Reads --memory-budget=<megabytes>.
+    Input: <options>, dict from parse_options
+    Output: budget in bytes, None if not given, or False if invalid"""
+    if "memory-budget" not in options:
+        return None
+    try:
+        return int(float(options["memory-budget"]) * 2**20)
+    except (TypeError, ValueError):
+        return False
+
+def do_check_circles(args):
+    """Runs the check-circles command: python3 l1_linfty.py check-circles <max_grid_size>
+    Input: <args>, positional arguments after "check-circles"
+    Output: True if the input was good, False otherwise (prints the result,
+            and exits with status 1 if the checks differ)"""
+    if len(args) != 1:
+        return False
+    try:
+        max_grid_size = int(args[0])
+    except ValueError:
+        return False
+    all_good = True
+    for grid_size in range(1, max_grid_size + 1):
+        good, sets, differences = check_linfty_circles(grid_size)
+        print("grid_size", grid_size, ":", sets, "sets,", differences, "differences")
+        all_good = all_good and good
+    if not all_good:
+        sys.exit(1)
+    return True
+
+# Options of a single search which sweep does not support (the output of
+# each target is not shown, and there is one profile per process).
+SWEEP_UNSUPPORTED = ["count", "estimate-only", "eta", "profile", "cprofile"]
+
+def do_sweep(args, options):
+    """Runs the sweep command: python3 l1_linfty.py sweep <norms> <sizes> <grid_sizes>
+    Input: <args>, positional arguments after "sweep"
+           <options>, dict from parse_options
+    Output: True if the input was good, False otherwise"""
+    if len(args) != 3:
+        return False
+    try:
+        norms = [NORMS[mode] for mode in args[0].split(",")]
+        crescent_sizes = parse_range(args[1])
+        grid_sizes = parse_range(args[2])
+        jobs = int(options.get("jobs", 0)) or None
+    except (KeyError, ValueError):
+        return False
+    for name in SWEEP_UNSUPPORTED:
+        if name in options:
+            print("--" + name, "is not supported by sweep")
+            return False
+    kwargs = search_options(options)
+    memory_budget = memory_budget_option(options)
+    if kwargs is None or memory_budget is False or not norms or not crescent_sizes or not grid_sizes:
+        return False
+    start_time = time.time()
+    results = sweep(norms, crescent_sizes, grid_sizes, jobs, kwargs, memory_budget)
+    print_sweep_table(results)
+    print("Sweep time: ", time.time() - start_time)
+    return True
+
 def do():
     print(sys.argv)
-    if len(sys.argv) <= 3:
+    args, options = parse_options(sys.argv[1:])
+    if args and args[0] == "sweep":
+        return do_sweep(args[1:], options)
+    if args and args[0] == "check-circles":
+        return do_check_circles(args[1:])
+    if len(args) <= 2:
         return False
-    elif len(sys.argv) >= 4:
-        mode = sys.argv[1]
+    elif len(args) >= 3:
+        mode = args[0]
         try:
-            crescent_size = int(sys.argv[2])
-            grid_size = int(sys.argv[3])
+            crescent_size = int(args[1])
+            grid_size = int(args[2])
         except ValueError:
             return False
         # Detect norm.
-        if mode == "l1":
-            norm = 1
-        elif mode == "linfty":
-            norm = 0
-        else:
+        if mode not in NORMS:
             return False
+        norm = NORMS[mode]
         # Detect speed.
         speed = "fast" # for now, always run fast
         # TODO Add back in slow/fast option
-        # if len(sys.argv) == 4:
+        # if len(args) == 3:
         #     speed = "slow"
         # else:
-        #     speed = sys.argv[4]
+        #     speed = args[3]
         #     if speed != "fast" and speed != "slow":
         #         return False
+        # Detect search order.
+        kwargs = search_options(options)
+        memory_budget = memory_budget_option(options)
+        if kwargs is None or memory_budget is False:
+            return False
+        estimate_probes = options.get("estimate-only")
+        if estimate_probes is not None:
+            try:
+                estimate_probes = DEFAULT_PROBES if estimate_probes is True else int(estimate_probes)
+            except ValueError:
+                return False
         # Norm and speed are good, so run computation.
-        sto_values = init_sto(norm, grid_size, True)
+        start_profile(options, {"argv": sys.argv, "norm": mode,
+                                "crescent_size": crescent_size,
+                                "grid_size": grid_size, "speed": speed,
+                                "order": kwargs["order"], "seed": kwargs["seed"]})
+        sto_values = init_sto(norm, grid_size, True, None, memory_budget)
+        nogood_store = kwargs["nogood_store"]
+        if nogood_store is not None:
+            nogood_store["limit_bytes"] = memory_limits(norm, memory_budget, sto_values[0])["nogoods"]
+        if estimate_probes is not None:
+            with profiling.phase("estimate"):
+                root = order_candidates(norm, kwargs["order"], simple_methods.grid_points(grid_size), [],
+                                        grid_size, sto_values)
+                vf = None
+                if kwargs["vectorize"]:
+                    vf = vector_filter.new_vector_filter(norm, grid_size, sto_values[0])
+                progress = estimate_search(norm, crescent_size, grid_size, sto_values, speed,
+                                           root, [], estimate_probes, random.Random(kwargs["seed"] or 0),
+                                           kwargs["order"], vf)
+            print_estimate(progress)
+            profiling.record("estimate", {k: progress[k] for k in ["nodes", "seconds", "seconds_per_node",
+                                                                   "probes", "time"]})
+            finish_profile(options)
+            return True
         start_time = time.time()
-        find_crescent_set( norm, crescent_size, grid_size, sto_values, speed)
+        with profiling.phase("search"):
+            if "count" in options:
+                counts = count_crescent_sets(norm, crescent_size, grid_size, sto_values, speed,
+                                             kwargs["order"], kwargs["nogood_store"], kwargs["eta_probes"],
+                                             None, kwargs["vectorize"])
+                print("Crescent sets:", counts["raw"])
+                print("Up to translation:", counts["translation"])
+                print("Up to translation and symmetry:", counts["symmetry"])
+                print("Nodes:", counts["nodes"])
+                profiling.record("counts", {k: str(v) for k, v in counts.items()})
+            else:
+                find_crescent_set( norm, crescent_size, grid_size, sto_values, speed, **kwargs)
         print("Crescent computation time: ",time.time() - start_time)
+        if nogood_store is not None:
+            print("Nogoods:", nogoods.nogood_stats(nogood_store))
+        memory = memory_report(sto_values, nogood_store)
+        if memory_budget is not None:
+            for name, stats in memory.items():
+                print("Memory (" + name + "):", stats)
+        profiling.record("memory", memory)
+        finish_profile(options)
         return True
 
 if __name__ == "__main__":
@@ -191,6 +191,64 @@ def linfty_forbidden_circle_points(p1, p2, p3, grid_size):
             p4 = (p4[0], p4[1] - 1)
     return forbidden_pts
 
+def linfty_on_square(p, bottom_left, diam):
+    """Returns whether <p> lies on the square with <bottom_left> and <diam>,
+    i.e. max(|dx|, |dy|) == diam / 2 from its center (in doubled coordinates,
+    so that the center is a lattice point).
+    Input: <p>, <bottom_left> points, <diam> integer
+    Output: True / False"""
+    return max( abs(2*p[0] - 2*bottom_left[0] - diam),
+                abs(2*p[1] - 2*bottom_left[1] - diam) ) == diam
+
+def linfty_bounding_squares(xmin, xmax, ymin, ymax):
+    """Returns the squares which can have points with this bounding box on
+    them. A square with all the points on it has diameter at least
+    max(width, height) and can be shrunk to exactly that, keeping every point
+    on it. Then it lines up with the long sides of the box, and with one of
+    the short sides.
+    Input: <xmin>, <xmax>, <ymin>, <ymax>, bounding box of the points
+    Output: list of [bottom_left, diameter] (one or two squares)"""
+    width = xmax - xmin
+    height = ymax - ymin
+    if width > height:
+        return [ [(xmin, ymin), width], [(xmin, ymax - width), width] ]
+    if height > width:
+        return [ [(xmin, ymin), height], [(xmax - height, ymin), height] ]
+    return [ [(xmin, ymin), width] ]
+
+def linfty_new_point_on_circle(points, new_point):
+    """Returns 4 points of <points> + [<new_point>] (including <new_point>)
+    which lie on a common circle (square), or None if there are none. This
+    checks the triples (p, q, <new_point>) of all pairs of <points> in one
+    pass: for each pair the bounding box of the triple is kept, and every
+    other point s is tested against the squares of the bounding box with s
+    (linfty_bounding_squares, linfty_on_square), without listing circle
+    points. If <points> has no 4 points on a circle, this is the same as
+    checking linfty_forbidden_circle_points for all triples.
+    Input: <points>, list of points (not containing <new_point>)
+           <new_point>, point
+    Output: [p, q, new_point, s], or None"""
+    x, y = new_point
+    for i, p in enumerate(points):
+        pxmin, pxmax = min(x, p[0]), max(x, p[0])
+        pymin, pymax = min(y, p[1]), max(y, p[1])
+        for j in range(i + 1, len(points)):
+            q = points[j]
+            qxmin, qxmax = min(pxmin, q[0]), max(pxmax, q[0])
+            qymin, qymax = min(pymin, q[1]), max(pymax, q[1])
+            for s in points:
+                if s == p or s == q:
+                    continue
+                squares = linfty_bounding_squares(min(qxmin, s[0]), max(qxmax, s[0]),
+                                                  min(qymin, s[1]), max(qymax, s[1]))
+                for bottom_left, diam in squares:
+                    if (linfty_on_square(new_point, bottom_left, diam)
+                            and linfty_on_square(p, bottom_left, diam)
+                            and linfty_on_square(q, bottom_left, diam)
+                            and linfty_on_square(s, bottom_left, diam)):
+                        return [p, q, new_point, s]
+    return None
+
 def linfty_ball_points(center, radius, grid_size):
     """Returns set of points lying on the ball with <center>, <radius> on
         <grid_size>
@@ -0,0 +1,95 @@
+# nogoods.py
+# Description: This file contains the nogood store used by backtrack in
+# l1_linfty.py. A nogood is a node of the search whose whole subtree has been
+# searched without finding a crescent set (a dead subtree), so that the same
+# configuration is cut off when it comes up again elsewhere in the grid.
+# In the lex order the subtree of a set S searches S plus any of the grid
+# points after its last point. Shifting S to the right by t maps those points
+# (shifted back) into the points after S's own last point, so if S is dead,
+# then so is every shift of S to the right. Shifts up or down, and the
+# symmetries of the square, do not have this property. A nogood is therefore
+# stored with its smallest x coordinate moved to 0 (nogood_key), and the
+# shifts to the right come later in the lex order, after S has been searched.
+# This is only sound if every node is visited after all the nodes before it
+# in the lex order: the store must only be shared between searches with the
+# same (norm, crescent_size, grid_size) which together visit the nodes in
+# one increasing lex order, e.g. one backtrack without a seed. Work units run
+# in any other order (work_queue.py) each need their own store.
+# The store is bounded (by number of nogoods and optionally by bytes): when it
+# is full, the least recently used nogood is evicted.
+
+import collections
+
+import caches
+
+def new_nogood_store(limit = 100000, min_size = 1, limit_bytes = None):
+    """Returns an empty nogood store.
+    Input: <limit>, maximum number of nogoods kept (default 100000)
+           <min_size>, smaller configurations are not stored or looked up
+                       (default 1)
+           <limit_bytes>, maximum (approximate) number of bytes used by the
+                       nogoods, or None for no limit (default None)
+    Output: dict with the table of nogoods and the hit statistics"""
+    return {"table": collections.OrderedDict(), "limit": limit,
+            "min_size": min_size, "limit_bytes": limit_bytes, "bytes": 0,
+            "lookups": 0, "hits": 0, "stores": 0, "evictions": 0}
+
+def nogood_key(store, points):
+    """Returns the key of <points> in <store>, or None if <points> is too small
+    to be stored.
+    Input: <store>, from new_nogood_store
+           <points>, list of points in increasing lexicographic order
+    Output: tuple of <points> shifted to x coordinate 0 (see the top of this
+            file), or None"""
+    if len(points) < store["min_size"]:
+        return None
+    x0 = points[0][0]
+    return tuple( (x - x0, y) for x, y in points )
+
+def is_nogood(store, key):
+    """Determines whether the configuration with key <key> is a known nogood
+    (dead subtree).
+    Input: <store>, from new_nogood_store
+           <key>, from nogood_key (None is never a nogood)
+    Output: True / False"""
+    if key is None:
+        return False
+    store["lookups"] += 1
+    table = store["table"]
+    if key in table:
+        table.move_to_end(key)
+        store["hits"] += 1
+        return True
+    return False
+
+def add_nogood(store, key):
+    """Adds the configuration with key <key> to <store>, evicting the least
+    recently used nogood if the store is full.
+    Input: <store>, from new_nogood_store
+           <key>, from nogood_key (None is ignored)
+    Output: void"""
+    if key is None or store["limit"] <= 0:
+        return
+    table = store["table"]
+    if key in table:
+        return
+    table[key] = True
+    store["stores"] += 1
+    store["bytes"] += caches.approx_size(key) + caches.ENTRY_OVERHEAD
+    limit_bytes = store["limit_bytes"]
+    while table and (len(table) > store["limit"]
+                     or (limit_bytes is not None and store["bytes"] > limit_bytes)):
+        old_key, value = table.popitem(last = False)
+        store["bytes"] -= caches.approx_size(old_key) + caches.ENTRY_OVERHEAD
+        store["evictions"] += 1
+
+def nogood_stats(store):
+    """Returns the statistics of <store>.
+    Input: <store>, from new_nogood_store
+    Output: dict with lookups, hits, hit_rate, stores, evictions, size and
+            bytes"""
+    lookups = store["lookups"]
+    return {"lookups": lookups, "hits": store["hits"],
+            "hit_rate": store["hits"] / lookups if lookups else 0.0,
+            "stores": store["stores"], "evictions": store["evictions"],
+            "size": len(store["table"]), "bytes": store["bytes"]}
@@ -0,0 +1,131 @@
+# profiling.py
+# Description: This file contains the --profile support used in l1_linfty.py.
+# It records wall and CPU time for each phase of a run (precompute, search),
+# call counts and time for the hot kernels, and writes a JSON report.
+# When no profile is active every function here is (nearly) free, so the
+# phase markers can stay in the normal code path.
+
+import json
+import time
+import cProfile
+import contextlib
+import functools
+
+# The active report, or None if we are not profiling.
+_report = None
+# Functions replaced by instrument(), as (module, name, original) triples.
+_instrumented = []
+# cProfile.Profile object, if a cProfile dump was requested.
+_cprofile = None
+
+def start(info = None, cprofile = False):
+    """Starts profiling. Phases and instrumented kernels are recorded from now
+    until stop() is called.
+    Input: <info>, dict of extra fields copied into the report (e.g. argv)
+           <cprofile>, whether to also run cProfile (default False)
+    Output: void"""
+    global _report, _cprofile
+    _report = {
+        "info": dict(info or {}),
+        "phases": dict(),
+        "kernels": dict(),
+        "start_wall": time.perf_counter(),
+        "start_cpu": time.process_time(),
+    }
+    if cprofile:
+        _cprofile = cProfile.Profile()
+        _cprofile.enable()
+
+@contextlib.contextmanager
+def phase(name):
+    """Context manager which records the wall and CPU time of a phase <name>.
+    Phases with the same name are accumulated. Does nothing if no profile is
+    active.
+    Input: <name>, string"""
+    if _report is None:
+        yield
+        return
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        entry = _report["phases"].setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+        entry["calls"] += 1
+        entry["wall"] += time.perf_counter() - start_wall
+        entry["cpu"] += time.process_time() - start_cpu
+
+def instrument(module, name, label = None):
+    """Replaces the function <module>.<name> by a wrapper which counts calls
+    and accumulates the (inclusive) wall time spent in it. Callers which look
+    the function up through the module (e.g.
+    linfty_methods.linfty_new_point_on_circle, or a global name inside
+    <module>) then go through the wrapper.
+    Input: <module>, a module object
+           <name>, name of the function in <module>
+           <label>, name used in the report (default <name>)
+    Output: void"""
+    if _report is None:
+        return
+    original = getattr(module, name)
+    entry = _report["kernels"].setdefault(label or name, {"calls": 0, "wall": 0.0})
+    perf_counter = time.perf_counter
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        t = perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            entry["calls"] += 1
+            entry["wall"] += perf_counter() - t
+    setattr(module, name, wrapper)
+    _instrumented.append((module, name, original))
+
+def record(name, value):
+    """Stores <value> under <name> in the "counters" of the report, e.g. hit
+    statistics of a cache. Does nothing if no profile is active.
+    Input: <name>, string
+           <value>, anything JSON can encode
+    Output: void"""
+    if _report is None:
+        return
+    _report.setdefault("counters", dict())[name] = value
+
+def stop():
+    """Stops profiling, restores instrumented functions and returns the report.
+    Output: report dict, or None if no profile was active."""
+    global _report, _cprofile
+    if _report is None:
+        return None
+    report = _report
+    _report = None
+    while _instrumented:
+        module, name, original = _instrumented.pop()
+        setattr(module, name, original)
+    report["total"] = {
+        "wall": time.perf_counter() - report.pop("start_wall"),
+        "cpu": time.process_time() - report.pop("start_cpu"),
+    }
+    if _cprofile is not None:
+        _cprofile.disable()
+        report["cprofile"] = _cprofile
+        _cprofile = None
+    return report
+
+def write_report(report, path, cprofile_path = None):
+    """Writes <report> (as returned by stop()) as JSON to <path>. If the report
+    has cProfile data and <cprofile_path> is given, dumps it there in pstats
+    format (readable with python -m pstats).
+    Input: <report>, dict
+           <path>, output path for the JSON report
+           <cprofile_path>, output path for the cProfile dump, or None
+    Output: void"""
+    report = dict(report)
+    profiler = report.pop("cprofile", None)
+    if profiler is not None and cprofile_path:
+        profiler.dump_stats(cprofile_path)
+        report["cprofile"] = cprofile_path
+    else:
+        report["cprofile"] = None
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -72,6 +72,78 @@ def forbidden_line_points(p1, p2, grid_size):
         line_pts.append( ( line_pts[-1][0] + step[0], line_pts[-1][1] + step[1] ) )
     return set( line_pts )
 
+def line_index(grid_size):
+    """Returns an index of the lattice lines of the grid <grid_size> which
+    contain at least 3 grid points (only those can have 3 points on a line).
+    Input: <grid_size>
+    Output: <line_index>, a list of two things:
+                <line_points>, list, the ith item is a tuple of the grid points
+                               on line i
+                <point_lines>, dict, key point, value tuple of the ids of the
+                               lines through the point"""
+    line_points = []
+    point_lines = { p: [] for p in grid_points(grid_size) }
+    # A line with 3 grid points has a step of at most half the grid.
+    half = grid_size // 2
+    for dx in range(0, half + 1):
+        for dy in range(-half, half + 1):
+            # Only primitive steps, and only one of step and -step.
+            if (dx == 0 and dy != 1) or math.gcd(dx, dy) != 1:
+                continue
+            for p in point_lines:
+                if in_grid( (p[0] - dx, p[1] - dy), grid_size ):
+                    continue # p is not the first point on its line
+                line = [ p ]
+                while in_grid( (line[-1][0] + dx, line[-1][1] + dy), grid_size ):
+                    line.append( (line[-1][0] + dx, line[-1][1] + dy) )
+                if len(line) >= 3:
+                    for q in line:
+                        point_lines[q].append(len(line_points))
+                    line_points.append(tuple(line))
+    return [line_points, { p: tuple(ids) for p, ids in point_lines.items() }]
+
+def new_line_counts(line_index):
+    """Returns occupancy counters for the lines of <line_index>, all 0.
+    Input: <line_index>, from line_index
+    Output: list of integers, one per line"""
+    return [0] * len(line_index[0])
+
+def add_to_lines(line_index, counts, p):
+    """Increments the counters <counts> of the lines through <p>.
+    Input: <line_index>, from line_index
+           <counts>, from new_line_counts
+           <p>, point
+    Output: True if some line now has 3 (or more) points, False otherwise"""
+    full = False
+    for i in line_index[1][p]:
+        counts[i] += 1
+        if counts[i] >= 3:
+            full = True
+    return full
+
+def remove_from_lines(line_index, counts, p):
+    """Decrements the counters <counts> of the lines through <p> (undoes
+    add_to_lines).
+    Input: <line_index>, from line_index
+           <counts>, from new_line_counts
+           <p>, point
+    Output: void"""
+    for i in line_index[1][p]:
+        counts[i] -= 1
+
+def three_on_a_line(line_index, points):
+    """Finds 3 points of <points> which lie on a line.
+    Input: <line_index>, from line_index
+           <points>, list or set of points
+    Output: tuple of the points of <points> on that line, or None"""
+    counts = dict()
+    for p in points:
+        for i in line_index[1][p]:
+            counts[i] = counts.get(i, 0) + 1
+            if counts[i] >= 3:
+                return tuple( q for q in line_index[0][i] if q in points )
+    return None
+
 def find_grid_size(points):
     """Finds grid size containing set of points
     Input: <points>, list or set of points
@@ -80,3 +152,63 @@ def find_grid_size(points):
     for p in points:
         grid_size = max( grid_size, p[0], p[1] )
     return grid_size 
+
+def grid_points(grid_size):
+    """Returns all points in the grid <grid_size> in lexicographic order (the
+    order of increment_point, starting at (0,0)).
+    Input: <grid_size>
+    Output: list of points"""
+    points = []
+    p = (0,0)
+    while p:
+        points.append(p)
+        p = increment_point(p, grid_size)
+    return points
+
+def luby(i):
+    """Returns the <i>th term of the Luby sequence 1,1,2,1,1,2,4,1,1,2,...
+    (used as a restart schedule).
+    Input: <i>, integer >= 1
+    Output: integer (a power of 2)"""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if i == (1 << k) - 1:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+def symmetric_images(points):
+    """Returns the images of <points> under the 8 symmetries of the square
+    (the dihedral group D4), each translated so that the smallest x and y
+    coordinates are 0 and written as a sorted tuple.
+    Input: <points>, list or set of points (not empty)
+    Output: list of 8 tuples of points (possibly with repeats)"""
+    xs = [ p[0] for p in points ]
+    ys = [ p[1] for p in points ]
+    min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+    # Coordinates measured from the left/right and bottom/top of the bounding
+    # box. Each element of D4 (followed by a translation back into the first
+    # quadrant) picks one of each and possibly swaps them.
+    u = [ x - min_x for x in xs ]
+    u_flip = [ max_x - x for x in xs ]
+    v = [ y - min_y for y in ys ]
+    v_flip = [ max_y - y for y in ys ]
+    return [ tuple(sorted(zip(a, b))) for a, b in
+             [ (u, v), (u_flip, v), (u, v_flip), (u_flip, v_flip),
+               (v, u), (v_flip, u), (v, u_flip), (v_flip, u_flip) ] ]
+
+def translation_count(points, grid_size):
+    """Returns the number of translates of <points> which lie in the grid
+    <grid_size> (the same for all images under D4).
+    Input: <points>, list or set of points (not empty), <grid_size>
+    Output: integer"""
+    width = max( p[0] for p in points ) - min( p[0] for p in points )
+    height = max( p[1] for p in points ) - min( p[1] for p in points )
+    return max(0, grid_size - width + 1) * max(0, grid_size - height + 1)
+
+def orbit_size(points, grid_size):
+    """Returns the number of sets of points in the grid <grid_size> which can
+    be obtained from <points> by a translation and an element of D4.
+    Input: <points>, list or set of points (not empty), <grid_size>
+    Output: integer"""
+    return len(set(symmetric_images(points))) * translation_count(points, grid_size)
@@ -0,0 +1,135 @@
+# vector_filter.py
+# Description: This file contains the NumPy candidate filter used by
+# l1_linfty.backtrack with --vectorize. For the current set of points it
+# computes, in a few array operations over the whole grid, which points can
+# still be added:
+#   - the distinct distances would stay below crescent_size,
+#   - no distance would occur more than crescent_size - 1 times (a crescent
+#     set has multiplicities 1, ..., crescent_size - 1), and
+#   - the point is not on a line which already has 2 points of the set.
+# All three only get worse when points are added, so a point which fails them
+# can be dropped from the candidates of the whole subtree. The remaining
+# checks (circles, line-like) are done one candidate at a time as before.
+# The filter keeps the distance multiplicities of the current set, for each
+# grid point the multiplicities of its distances to the set, and for each grid
+# point the number of lines through it with 2 points of the set. backtrack
+# updates them with push_point and pop_point as the set changes.
+# NumPy is only needed for --vectorize.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import simple_methods
+
+def new_vector_filter(norm, grid_size, line_index):
+    """Returns the arrays used by filter_candidates for the grid <grid_size>,
+    for an empty set of points.
+    Input: <norm>, 1 if L1, 0 if Linfty
+           <grid_size>
+           <line_index>, from simple_methods.line_index
+    Output: dict (raises ImportError if NumPy is not installed)"""
+    if numpy is None:
+        raise ImportError("--vectorize needs numpy")
+    grid = simple_methods.grid_points(grid_size)
+    index = { p: j for j, p in enumerate(grid) }
+    line_points = line_index[0]
+    # incidence[i, j] is True if grid point j lies on line i.
+    incidence = numpy.zeros((len(line_points), len(grid)), dtype = bool)
+    for i, line in enumerate(line_points):
+        incidence[i, [ index[p] for p in line ]] = True
+    width = 2 * grid_size + 1
+    coords = numpy.array(grid, dtype = numpy.int64)
+    vf = {"norm": norm, "grid": grid, "index": index, "coords": coords,
+          "incidence": incidence, "point_lines": line_index[1], "width": width,
+          "rows": numpy.arange(len(grid))}
+    # dists[i, j] = distance between grid points i and j
+    vf["dists"] = distances(vf, coords, coords)
+    return empty_copy(vf)
+
+def empty_copy(vf):
+    """Returns a filter for the same grid as <vf> with an empty set of points
+    (the arrays of the grid are shared).
+    Input: <vf>, from new_vector_filter
+    Output: dict"""
+    n = len(vf["grid"])
+    width = vf["width"]
+    # State of the current set: grid indices of its points, the multiplicities
+    # of its distances, the multiplicities of the distances from each grid
+    # point to it, and for each grid point the number of lines through it with
+    # 2 points of the set.
+    return dict(vf, chosen = [], multiplicities = numpy.zeros(width, dtype = numpy.int64),
+                point_multiplicities = numpy.zeros((n, width), dtype = numpy.int64),
+                blocked = numpy.zeros(n, dtype = numpy.int64))
+
+def point_indices(vf, points):
+    """Returns the grid indices of <points> as a NumPy array.
+    Input: <vf>, from new_vector_filter
+           <points>, list of points
+    Output: NumPy integer array"""
+    index = vf["index"]
+    return numpy.array([ index[p] for p in points ], dtype = numpy.intp)
+
+def index_points(vf, indices):
+    """Returns the points with grid indices <indices> (inverse of
+    point_indices).
+    Input: <vf>, from new_vector_filter
+           <indices>, NumPy integer array
+    Output: list of points"""
+    grid = vf["grid"]
+    return [ grid[j] for j in indices.tolist() ]
+
+def push_point(vf, p, line_counts):
+    """Adds <p> to the current set of <vf>.
+    Input: <vf>, from new_vector_filter
+           <p>, point
+           <line_counts>, line counters of the set with <p> (see
+                          simple_methods.add_to_lines)
+    Output: void"""
+    j = vf["index"][p]
+    vf["multiplicities"] += vf["point_multiplicities"][j]
+    vf["point_multiplicities"][vf["rows"], vf["dists"][j]] += 1
+    vf["chosen"].append(j)
+    for line in vf["point_lines"][p]:
+        if line_counts[line] == 2:
+            vf["blocked"] += vf["incidence"][line]
+
+def pop_point(vf, p, line_counts):
+    """Removes <p>, the last point added, from the current set of <vf>.
+    Input: <vf>, from new_vector_filter
+           <p>, point
+           <line_counts>, line counters of the set with <p> (see
+                          simple_methods.remove_from_lines)
+    Output: void"""
+    j = vf["chosen"].pop()
+    vf["point_multiplicities"][vf["rows"], vf["dists"][j]] -= 1
+    vf["multiplicities"] -= vf["point_multiplicities"][j]
+    for line in vf["point_lines"][p]:
+        if line_counts[line] == 2:
+            vf["blocked"] -= vf["incidence"][line]
+
+def filter_candidates(vf, pool_indices, crescent_size):
+    """Drops the candidates which can not be added to the current set of <vf>
+    (see the description at the top of this file).
+    Input: <vf>, from new_vector_filter
+           <pool_indices>, NumPy array of the grid indices of the candidates
+           <crescent_size>
+    Output: NumPy array, the grid indices of the remaining candidates (in the
+            same order)"""
+    pool_indices = pool_indices[vf["blocked"][pool_indices] == 0]
+    # Multiplicities of the distances after adding each candidate.
+    multiplicities = vf["point_multiplicities"][pool_indices] + vf["multiplicities"]
+    ok = (multiplicities > 0).sum(axis = 1) < crescent_size
+    ok &= multiplicities.max(axis = 1) < crescent_size
+    return pool_indices[ok]
+
+def distances(vf, from_coords, to_coords):
+    """Returns the matrix of distances between two arrays of points.
+    Input: <vf>, from new_vector_filter
+           <from_coords>, <to_coords>, NumPy arrays of shape (n, 2), (m, 2)
+    Output: NumPy array of shape (n, m)"""
+    diff = numpy.abs(from_coords[:, None, :] - to_coords[None, :, :])
+    if vf["norm"] == 1:
+        return diff.sum(axis = 2)
+    return diff.max(axis = 2)
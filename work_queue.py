@@ -0,0 +1,418 @@
+# work_queue.py
+# Description: This file runs find_crescent_set (l1_linfty.py) as a queue of
+# work units in a shared directory, so that workers on several machines (or
+# several processes on one machine) can split one search.
+# Each work unit is a prefix: the lexicographically smallest points of the
+# sets it searches (see l1_linfty.backtrack). The prefixes of a fixed length
+# split the search into disjoint parts, so if every unit is exhausted there is
+# no crescent set in the grid.
+#
+# Layout of the queue directory:
+#   job.json            norm, crescent_size, grid_size and search options
+#   pending/<unit>      units waiting for a worker
+#   claimed/<unit>@<worker>  units being run. A worker claims a unit by
+#                       renaming it from pending/ (atomic, so only one worker
+#                       gets it) and touches it while it runs. Claims which
+#                       have not been touched for --stale seconds (the worker
+#                       died) go back to pending/, and count as a failed
+#                       attempt (see MAX_ATTEMPTS).
+#   results/<unit>      result and statistics of each finished unit
+#   STOP                written when a crescent set is found, so that workers
+#                       stop claiming units
+# Only renames within one directory tree are used, so any shared filesystem
+# with atomic rename works (and so does the local one, for testing).
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import itertools
+import threading
+import subprocess
+
+import nogoods
+import simple_methods
+import l1_linfty
+
+# Seconds between touches of a claimed unit (at most, see heartbeat_interval).
+HEARTBEAT = 10
+# Claims not touched for this many seconds are stale (default of --stale).
+STALE_TIMEOUT = 120
+# A unit which failed this many times is given up (recorded as an error).
+MAX_ATTEMPTS = 3
+
+def queue_path(root, *parts):
+    """Returns the path of <parts> inside the queue directory <root>."""
+    return os.path.join(root, *parts)
+
+def write_json(path, data):
+    """Writes <data> as JSON to <path> atomically (other processes see either
+    the old file or the whole new one).
+    Input: <path>, <data>
+    Output: void"""
+    tmp_path = path + ".tmp." + worker_name()
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def read_json(path):
+    """Reads the JSON file <path>."""
+    with open(path) as f:
+        return json.load(f)
+
+def worker_name():
+    """Returns a name for this process which is unique across machines."""
+    return socket.gethostname() + "-" + str(os.getpid())
+
+def unit_prefixes(crescent_size, grid_size, depth):
+    """Returns the prefixes of the work units: all sets of <depth> grid points
+    in lexicographic order which leave enough points after them to make a set
+    of size <crescent_size>.
+    Input: <crescent_size>, <grid_size>, <depth>
+    Output: list of lists of points"""
+    grid = simple_methods.grid_points(grid_size)
+    depth = min(depth, crescent_size)
+    prefixes = []
+    for prefix in itertools.combinations(grid, depth):
+        if len(grid) - grid.index(prefix[-1]) - 1 >= crescent_size - depth:
+            prefixes.append(list(prefix))
+    return prefixes
+
+def init_queue(root, mode, crescent_size, grid_size, depth, options):
+    """Creates the queue directory <root> with one work unit per prefix.
+    Input: <root>, directory (created if needed, must not contain a queue)
+           <mode>, "l1" or "linfty"
+           <crescent_size>, <grid_size>
+           <depth>, number of points in each prefix
+           <options>, dict of search options (see l1_linfty.search_options),
+                      used by every worker
+    Output: number of work units"""
+    for name in ["pending", "claimed", "results"]:
+        os.makedirs(queue_path(root, name), exist_ok = True)
+    if os.path.exists(queue_path(root, "job.json")):
+        raise ValueError("queue already exists: " + root)
+    prefixes = unit_prefixes(crescent_size, grid_size, depth)
+    for i, prefix in enumerate(prefixes):
+        unit = {"unit": "%07d" % i, "prefix": prefix, "attempts": 0}
+        write_json(queue_path(root, "pending", unit["unit"]), unit)
+    write_json(queue_path(root, "job.json"),
+               {"norm": mode, "crescent_size": crescent_size, "grid_size": grid_size,
+                "depth": depth, "units": len(prefixes), "options": options})
+    return len(prefixes)
+
+def claim_unit(root, name):
+    """Claims a pending work unit for the worker <name>.
+    Input: <root>, queue directory
+           <name>, worker name
+    Output: [path of the claim, unit dict], or None if nothing is pending"""
+    for unit_name in sorted(os.listdir(queue_path(root, "pending"))):
+        if ".tmp." in unit_name:
+            continue
+        pending_path = queue_path(root, "pending", unit_name)
+        claim_path = queue_path(root, "claimed", unit_name + "@" + name)
+        try:
+            # Touch it first: rename keeps the mtime, and a claim with the old
+            # mtime from init could be reclaimed as stale right away.
+            os.utime(pending_path)
+            os.rename(pending_path, claim_path)
+        except FileNotFoundError:
+            continue # another worker was faster
+        return [claim_path, read_json(claim_path)]
+    return None
+
+def reclaim_stale(root, timeout = STALE_TIMEOUT):
+    """Moves claims which have not been touched for <timeout> seconds back to
+    pending/. A stale claim counts as a failed attempt (the worker may have
+    been killed by the unit, e.g. out of memory), so a unit which reaches
+    MAX_ATTEMPTS is recorded as an error instead.
+    Input: <root>, queue directory
+           <timeout>, seconds
+    Output: number of claims moved back"""
+    reclaimed = 0
+    now = time.time()
+    name = worker_name()
+    for claim_name in os.listdir(queue_path(root, "claimed")):
+        claim_path = queue_path(root, "claimed", claim_name)
+        try:
+            if now - os.path.getmtime(claim_path) < timeout:
+                continue
+            unit_name = claim_name.partition("@")[0]
+            if os.path.exists(queue_path(root, "results", unit_name)):
+                os.remove(claim_path) # finished, but the claim was left over
+                continue
+            # Take the claim over first (atomic, so only one process reclaims
+            # it). It keeps the old mtime, so if we die before giving it back
+            # it is reclaimed again later.
+            own_path = queue_path(root, "claimed", unit_name + "@reclaim-" + name)
+            os.rename(claim_path, own_path)
+        except FileNotFoundError:
+            continue # finished or reclaimed by someone else meanwhile
+        unit = read_json(own_path)
+        unit["attempts"] += 1
+        unit["error"] = "stale claim " + claim_name
+        if unit["attempts"] < MAX_ATTEMPTS:
+            write_json(queue_path(root, "pending", unit_name), unit)
+            reclaimed += 1
+        else:
+            write_json(queue_path(root, "results", unit_name),
+                       dict(unit, status = "error", worker = claim_name.partition("@")[2]))
+        os.remove(own_path)
+    return reclaimed
+
+def heartbeat_interval(stale_timeout):
+    """Returns the seconds between touches of a claimed unit, so that a live
+    claim is touched several times before it gets stale.
+    Input: <stale_timeout>, seconds after which claims are stale
+    Output: HEARTBEAT, or a quarter of <stale_timeout> if that is less"""
+    return min(HEARTBEAT, stale_timeout / 4)
+
+def heartbeat(claim_path, stop_event, interval = HEARTBEAT):
+    """Touches <claim_path> every <interval> seconds until <stop_event> is set
+    (run in a thread while the unit is searched).
+    Input: <claim_path>, <stop_event> threading.Event
+           <interval>, seconds (default HEARTBEAT)
+    Output: void"""
+    while not stop_event.wait(interval):
+        try:
+            os.utime(claim_path)
+        except FileNotFoundError:
+            return # reclaimed by someone else, the result is still written
+
+def load_job(root):
+    """Reads job.json and precomputes what the search of each unit needs.
+    Input: <root>, queue directory
+    Output: dict with the job and keyword arguments for l1_linfty.backtrack"""
+    job = read_json(queue_path(root, "job.json"))
+    norm = l1_linfty.NORMS[job["norm"]]
+    options = job["options"]
+    kwargs = l1_linfty.search_options(options)
+    memory_budget = l1_linfty.memory_budget_option(options)
+    if kwargs is None or memory_budget is False:
+        raise ValueError("bad options in job.json")
+    sto_values = l1_linfty.init_sto(norm, job["grid_size"], False, None, memory_budget)
+    # Template for the nogood store of each unit (see run_unit).
+    if kwargs["nogood_store"] is not None:
+        kwargs["nogood_store"]["limit_bytes"] = l1_linfty.memory_limits(norm, memory_budget, sto_values[0])["nogoods"]
+    rng = None
+    if kwargs["seed"] is not None:
+        rng = random.Random(kwargs["seed"])
+    job["search"] = {"norm": norm, "crescent_size": job["crescent_size"],
+                     "grid_size": job["grid_size"], "sto_values": sto_values,
+                     "speed": "fast", "order": kwargs["order"], "rng": rng,
+                     "nogood_store": kwargs["nogood_store"],
+                     "vectorize": kwargs["vectorize"]}
+    return job
+
+def run_unit(job, unit):
+    """Searches the work unit <unit>.
+    Input: <job>, from load_job
+           <unit>, unit dict
+    Output: result dict (status, crescent_set, nodes, time, worker)"""
+    start_time = time.time()
+    prefix = [ tuple(p) for p in unit["prefix"] ]
+    search = job["search"]
+    store = search["nogood_store"]
+    if store is not None:
+        # A nogood store is only sound while the nodes are visited in one
+        # increasing lex order (see nogoods.py). Units can be run in any order
+        # (and requeued), so each unit gets its own store.
+        search = dict(search, nogood_store = nogoods.new_nogood_store(store["limit"], store["min_size"],
+                                                                      store["limit_bytes"]))
+    status, crescent_set, count = l1_linfty.backtrack(prefix = prefix, **search)
+    return {"unit": unit["unit"], "prefix": unit["prefix"], "status": status,
+            "crescent_set": crescent_set, "nodes": count,
+            "time": time.time() - start_time, "worker": worker_name(),
+            "attempts": unit["attempts"] + 1}
+
+def worker(root, stale_timeout = STALE_TIMEOUT, poll = 5):
+    """Runs work units of the queue <root> until none are left (or a crescent
+    set was found).
+    Input: <root>, queue directory
+           <stale_timeout>, seconds after which claims are stale (this
+                            worker's own claims are touched well within it)
+           <poll>, seconds to wait when all remaining units are claimed
+    Output: number of units run"""
+    name = worker_name()
+    job = load_job(root)
+    done = 0
+    while not os.path.exists(queue_path(root, "STOP")):
+        claim = claim_unit(root, name)
+        if claim is None:
+            reclaim_stale(root, stale_timeout)
+            if not os.listdir(queue_path(root, "claimed")) and pending_count(root) == 0:
+                break
+            time.sleep(poll)
+            continue
+        claim_path, unit = claim
+        stop_event = threading.Event()
+        beat = threading.Thread(target = heartbeat, daemon = True,
+                                args = (claim_path, stop_event, heartbeat_interval(stale_timeout)))
+        beat.start()
+        try:
+            result = run_unit(job, unit)
+        except Exception as e:
+            # Give the unit back, or give up on it.
+            unit["attempts"] += 1
+            unit["error"] = repr(e)
+            if unit["attempts"] < MAX_ATTEMPTS:
+                write_json(queue_path(root, "pending", unit["unit"]), unit)
+            else:
+                write_json(queue_path(root, "results", unit["unit"]),
+                           dict(unit, status = "error", worker = name))
+            result = None
+        finally:
+            stop_event.set()
+            beat.join()
+        if result is not None:
+            write_json(queue_path(root, "results", unit["unit"]), result)
+            done += 1
+            if result["status"] == "found":
+                write_json(queue_path(root, "STOP"), {"unit": unit["unit"], "worker": name})
+        try:
+            os.remove(claim_path)
+        except FileNotFoundError:
+            pass
+    return done
+
+def pending_count(root):
+    """Returns the number of pending units of the queue <root>."""
+    return len([ n for n in os.listdir(queue_path(root, "pending")) if ".tmp." not in n ])
+
+def aggregate(root):
+    """Collects the results of the queue <root> and writes them to
+    summary.json.
+    Input: <root>, queue directory
+    Output: summary dict. "result" is "found" (with "crescent_sets"), "none"
+            (every unit exhausted: there is no crescent set in the grid),
+            "error" (some unit failed MAX_ATTEMPTS times) or "running"."""
+    job = read_json(queue_path(root, "job.json"))
+    results = []
+    for unit_name in sorted(os.listdir(queue_path(root, "results"))):
+        if ".tmp." not in unit_name:
+            results.append(read_json(queue_path(root, "results", unit_name)))
+    found = [ r["crescent_set"] for r in results if r["status"] == "found" ]
+    errors = [ r["unit"] for r in results if r["status"] == "error" ]
+    if found:
+        result = "found"
+    elif errors:
+        result = "error"
+    elif len(results) == job["units"]:
+        result = "none"
+    else:
+        result = "running"
+    summary = {"job": job, "result": result, "crescent_sets": found,
+               "errors": errors, "units": job["units"], "done": len(results),
+               "pending": pending_count(root),
+               "claimed": len(os.listdir(queue_path(root, "claimed"))),
+               "nodes": sum( r.get("nodes", 0) for r in results ),
+               "cpu_time": sum( r.get("time", 0) for r in results ),
+               "workers": sorted(set( r["worker"] for r in results ))}
+    write_json(queue_path(root, "summary.json"), summary)
+    return summary
+
+def print_summary(summary):
+    """Prints a summary from aggregate."""
+    job = summary["job"]
+    print(job["norm"], "crescent_size", job["crescent_size"], "grid_size", job["grid_size"])
+    print("Units:", summary["done"], "done,", summary["claimed"], "claimed,",
+          summary["pending"], "pending, of", summary["units"])
+    print("Nodes:", summary["nodes"], " CPU time:", summary["cpu_time"],
+          " Workers:", len(summary["workers"]))
+    if summary["result"] == "found":
+        print("Crescent found!", summary["crescent_sets"][0])
+    elif summary["result"] == "none":
+        print("No crescent set, try a bigger grid_size.")
+    elif summary["result"] == "error":
+        print("Failed units:", summary["errors"])
+
+def coordinate(root, workers = 0, stale_timeout = STALE_TIMEOUT, poll = 5):
+    """Waits for the queue <root> to finish, reclaiming stale claims and
+    aggregating results. Starts <workers> local worker processes first.
+    Input: <root>, queue directory
+           <workers>, number of local workers to start (default 0)
+           <stale_timeout>, seconds after which claims are stale
+           <poll>, seconds between checks
+    Output: summary dict (see aggregate)"""
+    processes = [ subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", root,
+                                    "--stale=" + str(stale_timeout), "--poll=" + str(poll)])
+                  for i in range(workers) ]
+    while True:
+        reclaim_stale(root, stale_timeout)
+        summary = aggregate(root)
+        if summary["result"] != "running":
+            break
+        if processes and all( p.poll() is not None for p in processes ):
+            break # local workers gave up (e.g. STOP), nothing more will come
+        time.sleep(poll)
+    if summary["result"] == "found" and not os.path.exists(queue_path(root, "STOP")):
+        write_json(queue_path(root, "STOP"), {"unit": None, "worker": worker_name()})
+    for p in processes:
+        p.wait()
+    return aggregate(root)
+
+#####################################################
+#####################################################
+######      Main  ###################################
+#####################################################
+#####################################################
+
+def print_usage(args):
+    print("Usage: python3 "+args[0]+" init <dir> <norm> <crescent_size> <grid_size>")
+    print("\t Creates a queue of work units in <dir>. Option --depth=<n> sets the")
+    print("\t number of points in each prefix (default 2). Search options of")
+    print("\t l1_linfty.py (--order, --seed, --nogoods, --vectorize, --memory-budget) are")
+    print("\t used by every worker.")
+    print("   or: python3 "+args[0]+" worker <dir>")
+    print("\t Runs units of the queue until none are left.")
+    print("   or: python3 "+args[0]+" coordinate <dir>")
+    print("\t Reclaims stale claims and aggregates results until the queue is")
+    print("\t done. Option --workers=<n> also starts n local workers.")
+    print("   or: python3 "+args[0]+" status <dir>")
+    print("\t Aggregates and prints the results so far.")
+    print("options:")
+    print("\t --stale=<seconds>: claims not touched for this long are given to")
+    print("\t                    another worker (default "+str(STALE_TIMEOUT)+"). Workers touch")
+    print("\t                    their claims every min("+str(HEARTBEAT)+", stale / 4) seconds; use")
+    print("\t                    the same value for every process on a queue.")
+    print("\t --poll=<seconds>: how often to check the queue (default 5).")
+
+def do():
+    args, options = l1_linfty.parse_options(sys.argv[1:])
+    if len(args) < 2:
+        return False
+    command, root = args[0], args[1]
+    try:
+        stale_timeout = float(options.pop("stale", STALE_TIMEOUT))
+        poll = float(options.pop("poll", 5))
+        if command == "init":
+            if len(args) != 5 or args[2] not in l1_linfty.NORMS:
+                return False
+            crescent_size, grid_size = int(args[3]), int(args[4])
+            depth = int(options.pop("depth", 2))
+        workers = int(options.pop("workers", 0))
+    except ValueError:
+        return False
+    if stale_timeout <= 0 or poll <= 0:
+        return False
+    if command == "init":
+        if l1_linfty.search_options(options) is None or l1_linfty.memory_budget_option(options) is False:
+            return False
+        units = init_queue(root, args[2], crescent_size, grid_size, depth, options)
+        print("Created", units, "work units in", root)
+    elif command == "worker":
+        print("Worker", worker_name(), "ran", worker(root, stale_timeout, poll), "units")
+    elif command == "coordinate":
+        print_summary(coordinate(root, workers, stale_timeout, poll))
+    elif command == "status":
+        reclaim_stale(root, stale_timeout)
+        print_summary(aggregate(root))
+    else:
+        return False
+    return True
+
+if __name__ == "__main__":
+    good_input = do()
+    if not good_input:
+        print_usage(sys.argv)